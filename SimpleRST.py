@@ -1,17 +1,1057 @@
 import ast
 import re
+from array import array
 from operator import itemgetter, attrgetter
-from tempfile import NamedTemporaryFile
-from collections import deque
-from itertools import tee, izip_longest, dropwhile, chain
-import shutil
-import argparse
+from collections import namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
 import fnmatch
 import os
+import sys
+import signal
+import string
+# The modules needed by a few options only (the server, the worker pool, git,
+# -diff, -report...) are imported where they are used, so that documenting a
+# single file doesn't pay for them at start-up.
+
+from simplerst_extraction import ExtractionCache, extract, load_extraction
 
 
 SIGNATURE = """Documentation created using SimpleRST. Source: https://github.com/Kasramvd/SimpleRST\n"""
 
+TEMPLATE_FILES = {
+    'function': 'temp_function.rst',
+    'class': 'temp_class.rst',
+    'attribute': 'attribute.rst',
+    'module': 'module.rst'}
+
+# Where setup.py installs the default templates, relative to the installation prefix.
+TEMPLATE_DATA_DIR = os.path.join('share', 'simplerst')
+
+# The `name(type): description` lines of the legacy docstrings.
+ARG_REGEX = re.compile(r'^\s*([^:]*)\(([^)]*)\):(.*)$', re.DOTALL)
+# The `:param name:`/`:type name:` and `:returns:` lines of a rendered docstring.
+RENDERED_ARG_REGEX = re.compile(r'^[ \t]*:(param|type) (\S*):(?: )?(.*)$', re.MULTILINE)
+RENDERED_RETURNS_REGEX = re.compile(r'^[ \t]*:returns:(?: )?(.*)$', re.MULTILINE)
+
+_formatter = string.Formatter()
+
+_TRAILING_SPACE = re.compile(r'[ \t]+(?=\n)')
+
+
+class Template(object):
+    """
+    .. py:class:: Template(text, mtime=None)
+
+      A pre-compiled RST template. The replacement fields of the template get
+      parsed once and `render` just fills them in, which produces the same
+      result as `text.format(**mapping)`.
+
+    """
+    def __init__(self, text, mtime=None):
+        self.text = text
+        self.mtime = mtime
+        self._pieces = list(_formatter.parse(text))
+
+    def render(self, mapping):
+        result = []
+        for literal, field_name, format_spec, conversion in self._pieces:
+            result.append(literal)
+            if field_name is not None:
+                obj, _ = _formatter.get_field(field_name, (), mapping)
+                obj = _formatter.convert_field(obj, conversion)
+                result.append(format(obj, format_spec))
+        return ''.join(result)
+
+    def match(self, text, mapping):
+        """
+        .. py:attribute:: match()
+
+            Check whether `text` is a rendering of the template in which the
+            fields of `mapping` have their value, the other fields being free.
+            The trailing whitespace of the lines and the blank lines around the
+            text are ignored, as `ast.get_docstring` drops them.
+           :rtype: dict (the values of the free fields) or None
+        """
+        chunks = ['']
+        free = []
+        for literal, field_name, format_spec, conversion in self._pieces:
+            chunks[-1] += literal
+            if field_name is None:
+                continue
+            try:
+                obj, _ = _formatter.get_field(field_name, (), mapping)
+            except (KeyError, AttributeError):
+                free.append(field_name)
+                chunks.append('')
+                continue
+            chunks[-1] += format(_formatter.convert_field(obj, conversion), format_spec)
+        chunks = [_TRAILING_SPACE.sub('', chunk) for chunk in chunks]
+        chunks[0] = chunks[0].lstrip('\n')
+        chunks[-1] = chunks[-1].rstrip()
+        text = _TRAILING_SPACE.sub('', text).strip('\n').rstrip()
+        if not text.startswith(chunks[0]):
+            return None
+        position = len(chunks[0])
+        values = {}
+        last = len(free)
+        for i, field_name in enumerate(free, 1):
+            chunk = chunks[i]
+            # The last chunk ends the text, the others are matched lazily.
+            found = text.find(chunk, position) if i < last else len(text) - len(chunk)
+            if found < position or not text.startswith(chunk, found):
+                return None
+            value = text[position:found]
+            if values.setdefault(field_name, value) != value:
+                return None
+            position = found + len(chunk)
+        return values if position == len(text) else None
+
+
+class TemplateRegistry(object):
+    """
+    .. py:class:: TemplateRegistry(directory=None, package=None, texts=None)
+
+      Load and compile every template once per process. Templates are read
+      from `directory` (the current working directory by default) or, when
+      `package` is given, from the resources of that package.
+
+      Templates can also be given in memory, as a `texts` dict mapping the
+      template names (the keys of `TEMPLATE_FILES`) to their text.
+
+      Call `refresh` to drop the templates whose file has been modified since
+      they were loaded.
+
+    """
+    def __init__(self, directory=None, package=None, texts=None):
+        self.directory = directory or ''
+        self.package = package
+        self._cache = {}
+        # Templates given as strings are kept in memory and never reloaded.
+        for name, text in (texts or {}).items():
+            self._cache[name] = Template(text)
+
+    def path(self, name):
+        return os.path.join(self.directory, TEMPLATE_FILES[name])
+
+    def load(self, name):
+        if self.package:
+            import pkgutil
+            return Template(pkgutil.get_data(self.package, TEMPLATE_FILES[name]))
+        path = self.path(name)
+        mtime = os.stat(path).st_mtime
+        with open(path) as fi:
+            return Template(fi.read(), mtime)
+
+    def get(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            template = self._cache[name] = self.load(name)
+            return template
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+    def refresh(self):
+        for name, template in list(self._cache.items()):
+            if template.mtime is None:
+                continue
+            try:
+                mtime = os.stat(self.path(name)).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != template.mtime:
+                self.invalidate(name)
+
+
+def default_template_dir():
+    """
+    .. py:function:: default_template_dir()
+
+       The directory of the default templates: the directory of this module
+       in a source checkout, otherwise the `TEMPLATE_DATA_DIR` of the prefix
+       SimpleRST is installed to (``sys.prefix``, or the user base of a
+       ``pip install --user``, three levels above ``site-packages``).
+
+       :rtype: string
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    candidates = [here,
+                  os.path.join(sys.prefix, TEMPLATE_DATA_DIR),
+                  os.path.join(here, os.pardir, os.pardir, os.pardir, TEMPLATE_DATA_DIR)]
+    for directory in candidates:
+        if os.path.exists(os.path.join(directory, TEMPLATE_FILES['function'])):
+            return os.path.normpath(directory)
+    return here
+
+
+def diff_path(file_name):
+    """
+    .. py:function:: diff_path(file_name)
+
+       The path of a file in the headers of a diff, without `..` components:
+       relative to the current directory when the file is inside it,
+       otherwise absolute (without the leading slash).
+
+       :rtype: string
+    """
+    path = os.path.abspath(file_name)
+    relative = os.path.relpath(path)
+    if relative != os.pardir and not relative.startswith(os.pardir + os.sep):
+        path = relative
+    return path.replace(os.sep, '/').lstrip('/')
+
+
+def unified_diff(source, new_source, file_name):
+    import difflib
+    file_name = diff_path(file_name)
+    return ''.join(difflib.unified_diff(
+        source.splitlines(True),
+        new_source.splitlines(True),
+        'a/' + file_name,
+        'b/' + file_name))
+
+
+def file_digest(file_name):
+    import hashlib
+    with open(file_name, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class FileCache(object):
+    """
+    .. py:class:: FileCache(path, fingerprint)
+
+      A persistent map from file paths to the content hash that each file had
+      after SimpleRST processed it. The entries are only valid for the given
+      `fingerprint` (the templates and formats the files were rendered with),
+      a cache written with another fingerprint is discarded on load.
+
+    """
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.files = {}
+        import json
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        if data.get('fingerprint') == fingerprint:
+            self.files = data.get('files', {})
+
+    def get(self, file_name):
+        return self.files.get(os.path.abspath(file_name))
+
+    def set(self, file_name, digest):
+        self.files[os.path.abspath(file_name)] = digest
+
+    def save(self):
+        import json
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'fingerprint': self.fingerprint, 'files': self.files}, f)
+        os.rename(temp_path, self.path)
+
+
+# `os.rename` already replaces the target atomically on POSIX.
+_replace = getattr(os, 'replace', os.rename)
+
+
+class FileCommitter(object):
+    """
+    .. py:class:: FileCommitter(batch=False, fsync='none')
+
+      Write files atomically: the new content goes to a temporary file created
+      next to its target, on the same file system, which then replaces the
+      target with a single rename. In `batch` mode the renames are delayed
+      until `commit`, so that a run which fails or gets interrupted before the
+      end leaves all the files untouched (`rollback` removes the temporary
+      files). `fsync` is one of:
+
+      * ``file``: sync every temporary file before it replaces its target.
+      * ``batch``: sync all the temporary files, then their directories, at `commit`.
+      * ``none``: leave it to the operating system.
+
+    """
+    FSYNC_POLICIES = ('file', 'batch', 'none')
+
+    def __init__(self, batch=False, fsync='none'):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError('Unknown fsync policy {!r}'.format(fsync))
+        self.batch = batch
+        self.fsync = fsync
+        # The (temporary file, target) pairs waiting for `commit`.
+        self.pending = []
+
+    @contextmanager
+    def open(self, target):
+        """
+        .. py:attribute:: open()
+
+            Return a context manager giving a file object which replaces
+            `target` once it is closed (or at `commit` in `batch` mode). The
+            target keeps its permissions. Nothing is replaced if the block
+            raises an exception.
+           :rtype: file
+        """
+        import shutil
+        from tempfile import mkstemp
+        directory, name = os.path.split(os.path.abspath(target))
+        fd, temp_path = mkstemp(prefix='.' + name + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+                if self.fsync == 'file':
+                    f.flush()
+                    os.fsync(f.fileno())
+            if os.path.exists(target):
+                shutil.copymode(target, temp_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.pending.append((temp_path, target))
+        if not self.batch:
+            self.commit()
+
+    def path(self, target):
+        """
+        .. py:attribute:: path()
+
+            Return the file holding the latest content of `target`, which is a
+            temporary file until the batch is committed.
+           :rtype: string
+        """
+        for temp_path, pending_target in reversed(self.pending):
+            if pending_target == target:
+                return temp_path
+        return target
+
+    def commit(self):
+        """
+        .. py:attribute:: commit()
+
+            Replace the targets of the pending files.
+           :rtype: int (the number of replaced files)
+        """
+        pending, self.pending = self.pending, []
+        if self.fsync == 'batch':
+            for temp_path, target in pending:
+                with open(temp_path, 'rb') as f:
+                    os.fsync(f.fileno())
+        for temp_path, target in pending:
+            _replace(temp_path, target)
+        if self.fsync != 'none':
+            # Make the renames themselves durable.
+            for directory in set(os.path.dirname(os.path.abspath(target)) for temp_path, target in pending):
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        return len(pending)
+
+    def rollback(self):
+        """
+        .. py:attribute:: rollback()
+
+            Remove the pending files, leaving their targets untouched.
+           :rtype: None
+        """
+        pending, self.pending = self.pending, []
+        for temp_path, target in pending:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+class NullStats(object):
+    """
+    .. py:class:: NullStats()
+
+      The statistics collector used when `-stats` is off, all the calls are
+      no-ops so the instrumentation costs next to nothing.
+
+    """
+    enabled = False
+
+    def start_file(self, file_name):
+        pass
+
+    def end_file(self, status, error=None):
+        pass
+
+    def phase(self, name):
+        return _null_phase
+
+    def iter(self, name, iterable):
+        return iterable
+
+    def add(self, key, value=1):
+        pass
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_phase = _NullPhase()
+
+
+class Stats(NullStats):
+    """
+    .. py:class:: Stats(hooks=())
+
+      Record the wall time of every phase (exclusive of the nested phases), the
+      bytes read, written and changed, the number of documented objects (and
+      of those already documented) and the error, if any, of each file.
+      Every `hooks` callable is called with the record of each finished file.
+
+    """
+    enabled = True
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.files = []
+        self.record = None
+        self._start = None
+        self._stack = []
+
+    def start_file(self, file_name):
+        self.record = {'file': file_name,
+                       'status': None,
+                       'seconds': 0.0,
+                       'phases': {},
+                       'bytes_read': 0,
+                       'bytes_written': 0,
+                       'bytes_changed': 0,
+                       'objects': 0,
+                       'current': 0,
+                       'error': None}
+        self._start = default_timer()
+
+    def end_file(self, status, error=None):
+        record, self.record = self.record, None
+        record['status'] = status
+        if error is not None:
+            record['error'] = {'type': type(error).__name__, 'message': str(error)}
+        record['seconds'] = default_timer() - self._start
+        self._stack = []
+        self.merge(record)
+        return record
+
+    def merge(self, record):
+        self.files.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def enter(self, name):
+        now = default_timer()
+        if self._stack:
+            # Pause the enclosing phase.
+            self._charge(self._stack[-1], now)
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = default_timer()
+        self._charge(self._stack.pop(), now)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def _charge(self, frame, now):
+        phases = self.record['phases']
+        phases[frame[0]] = phases.get(frame[0], 0.0) + now - frame[1]
+
+    @contextmanager
+    def phase(self, name):
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def iter(self, name, iterable):
+        """
+        .. py:attribute:: iter()
+
+            Charge the time spent in producing each item of `iterable` to `name`.
+           :rtype: generator
+        """
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def add(self, key, value=1):
+        self.record[key] += value
+
+    def totals(self):
+        totals = {'files': len(self.files),
+                  'seconds': 0.0,
+                  'phases': {},
+                  'bytes_read': 0,
+                  'bytes_written': 0,
+                  'bytes_changed': 0,
+                  'objects': 0,
+                  'current': 0,
+                  'statuses': {}}
+        for record in self.files:
+            for key in ('seconds', 'bytes_read', 'bytes_written', 'bytes_changed', 'objects', 'current'):
+                totals[key] += record.get(key, 0)
+            totals['statuses'][record['status']] = totals['statuses'].get(record['status'], 0) + 1
+            for name, seconds in record['phases'].items():
+                totals['phases'][name] = totals['phases'].get(name, 0.0) + seconds
+        return totals
+
+    def as_dict(self):
+        return {'files': self.files, 'totals': self.totals()}
+
+    def summary(self, limit=10):
+        totals = self.totals()
+        lines = ['*** {files} files in {seconds:.3f}s, {bytes_read} bytes read, '
+                 '{bytes_written} bytes written, {objects} objects ({current} already documented) ***'
+                 .format(**totals),
+                 'Files: ' + ', '.join('{} {}'.format(count, status)
+                                       for status, count in sorted(totals['statuses'].items())),
+                 'Phases:']
+        for name, seconds in sorted(totals['phases'].items(), key=itemgetter(1), reverse=True):
+            share = 100 * seconds / totals['seconds'] if totals['seconds'] else 0
+            lines.append('  {:<12} {:>9.3f}s {:>6.1f}%'.format(name, seconds, share))
+        lines.append('Slowest files:')
+        for record in sorted(self.files, key=itemgetter('seconds'), reverse=True)[:limit]:
+            lines.append('  {:>9.3f}s  {}'.format(record['seconds'], record['file']))
+        return '\n'.join(lines)
+
+
+class RunReport(object):
+    """
+    .. py:class:: RunReport(output, format='jsonl')
+
+      A `Stats` hook which streams the record of every finished file to
+      `output` as soon as it is known, followed by a summary record when the
+      report is closed. The records are JSON objects with a `type` of ``file``
+      or ``summary``, written one per line (``jsonl``) or as the items of a
+      JSON array (``json``).
+
+    """
+    FORMATS = ('json', 'jsonl')
+
+    def __init__(self, output, format='jsonl'):
+        if format not in self.FORMATS:
+            raise ValueError('Unknown report format {!r}'.format(format))
+        self.output = output
+        self.format = format
+        self.count = 0
+        self._start = default_timer()
+        if format == 'json':
+            self.output.write('[\n')
+
+    def __call__(self, record):
+        data = dict(record, type='file')
+        self.write(data)
+
+    def write(self, data):
+        import json
+        line = json.dumps(data, sort_keys=True)
+        if self.format == 'json':
+            line = (',\n' if self.count else '') + line
+        else:
+            line += '\n'
+        self.output.write(line)
+        self.output.flush()
+        self.count += 1
+
+    def close(self, totals, **extra):
+        """
+        .. py:attribute:: close()
+
+            Write the summary record: the `totals` of the run, its wall time and
+            the `extra` items.
+           :rtype: None
+        """
+        summary = dict(totals, type='summary', wall_seconds=default_timer() - self._start, **extra)
+        self.write(summary)
+        if self.format == 'json':
+            self.output.write('\n]\n')
+        self.output.flush()
+
+
+class ObjectInfo(object):
+    """
+    .. py:class:: ObjectInfo(name, lineno, type_, docstring, args=None)
+
+      The record of a class, function or method, filled in by the stages of
+      the pipeline: `extract_info` creates it, `parse_doc` sets `explain`,
+      `arguments`, `returns`, `doc_length` and `current` (whether the docstring
+      is already the rendering of its template) and `rewrite` sets `rst` and
+      `replaced`. `lineno` is 0-based and `args` is None for the classes.
+
+    """
+    __slots__ = ('name', 'lineno', 'type', 'docstring', 'args', 'explain',
+                 'arguments', 'returns', 'doc_length', 'current', 'rst', 'replaced')
+
+    def __init__(self, name, lineno, type_, docstring, args=None):
+        self.name = name
+        self.lineno = lineno
+        self.type = type_
+        self.docstring = docstring
+        self.args = args
+        self.explain = ''
+        self.arguments = []
+        self.returns = None
+        self.doc_length = 0
+        self.current = False
+        self.rst = None
+        self.replaced = False
+
+
+class Argument(object):
+    """
+    .. py:class:: Argument(name, types='', describe='')
+
+      An argument of a function, as documented in its docstring.
+
+    """
+    __slots__ = ('name', 'types', 'describe')
+
+    def __init__(self, name, types='', describe=''):
+        self.name = name
+        self.types = types
+        self.describe = describe
+
+
+class DocstringFormat(object):
+    """
+    .. py:class:: DocstringFormat()
+
+      Base class of the docstring parsers, registered by `name` in a
+      `DocstringFormats`. `marker` is a regex (without capturing groups)
+      matching a line that only this style produces, it's used to detect the
+      style of a docstring: the marker found first in the docstring wins.
+
+    """
+    name = None
+    marker = None
+
+    def parse(self, doc_lines, info):
+        """
+        .. py:attribute:: parse()
+
+            Read the lines of a docstring in a single pass and set the
+            `explain`, `arguments` and `returns` of its record.
+           :param doc_lines: The lines of the docstring
+           :type doc_lines: list
+           :param info: The record of the documented object
+           :type info: ObjectInfo
+           :rtype: boolean (whether the arguments of the signature have to be
+            documented as well)
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def add_explain(info, lines):
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if lines:
+            info.explain += '\n' + '\n'.join(lines)
+
+
+class LegacyFormat(DocstringFormat):
+    """
+    .. py:class:: LegacyFormat()
+
+      The `name(types): describe` lines, followed by their continuation lines.
+      The text before the first of them is the explanation, and when there is
+      such a text the arguments of the signature are documented as well.
+      A docstring with such a line before any section of the other styles
+      (e.g. a bare `Returns:` line after the arguments) is a legacy one.
+
+    """
+    name = 'legacy'
+    # The lines matched by `ARG_REGEX`.
+    marker = r'^[ \t]*[^:\n]*\([^)\n]*\):'
+
+    def parse(self, doc_lines, info):
+        match = ARG_REGEX.match
+        explain = []
+        groups = None
+        continuation = []
+        for line in doc_lines:
+            found = match(line)
+            if found:
+                if groups is not None:
+                    self.add_argument(info, groups, continuation)
+                groups = found.group(1, 2, 3)
+                continuation = []
+            elif groups is None:
+                explain.append(line)
+            else:
+                continuation.append(line)
+        if groups is not None:
+            self.add_argument(info, groups, continuation)
+        if explain:
+            info.explain += '\n' + '\n'.join(explain)
+        return bool(explain)
+
+    @staticmethod
+    def add_argument(info, groups, continuation):
+        name, types, describe = groups
+        if continuation:
+            describe = '\n'.join([describe] + continuation)
+        info.arguments.append(Argument(name, types, describe))
+
+
+class GoogleFormat(DocstringFormat):
+    """
+    .. py:class:: GoogleFormat()
+
+      `Args:` and `Returns:` sections, with `name (types): describe` items
+      whose continuation lines are indented deeper than the item. The other
+      sections are kept in the explanation.
+
+    """
+    name = 'google'
+    marker = (r'^[ \t]*(?:Args|Arguments|Keyword Args|Keyword Arguments|Parameters|Params'
+              r'|Returns|Return|Yields|Yield|Raises):[ \t]*$')
+    section_regex = re.compile(r'^[ \t]*([A-Z][A-Za-z ]*):[ \t]*$')
+    item_regex = re.compile(r'^[ \t]*(\*{0,2}\w+)[ \t]*(?:\(([^)]*)\))?[ \t]*:(.*)$')
+    sections = {'Args': 'params', 'Arguments': 'params', 'Parameters': 'params', 'Params': 'params',
+                'Keyword Args': 'params', 'Keyword Arguments': 'params',
+                'Returns': 'returns', 'Return': 'returns', 'Yields': 'returns', 'Yield': 'returns'}
+
+    def parse(self, doc_lines, info):
+        explain = []
+        returns = []
+        section = None
+        section_indent = item_indent = 0
+        item = None
+        for line in doc_lines:
+            stripped = line.strip()
+            indent = len(line) - len(line.lstrip())
+            if section is not None and stripped and indent <= section_indent:
+                section = None
+            if section is None:
+                found = self.section_regex.match(line)
+                section = found and self.sections.get(found.group(1).strip())
+                if section:
+                    section_indent = indent
+                    item_indent = None
+                else:
+                    explain.append(line)
+                continue
+            if not stripped:
+                continue
+            if item_indent is None:
+                item_indent = indent
+            if section == 'returns':
+                returns.append(stripped)
+                continue
+            found = indent == item_indent and self.item_regex.match(line)
+            if found:
+                item = Argument(found.group(1), (found.group(2) or '').strip(), found.group(3).strip())
+                info.arguments.append(item)
+            elif item is not None:
+                item.describe = (item.describe + ' ' + stripped).lstrip()
+        if returns:
+            info.returns = ' '.join(returns)
+        self.add_explain(info, explain)
+        return not info.arguments
+
+
+class NumpyFormat(DocstringFormat):
+    """
+    .. py:class:: NumpyFormat()
+
+      `Parameters` and `Returns` sections underlined with dashes, with
+      `name : types` items followed by their indented description. The other
+      sections are kept in the explanation.
+
+    """
+    name = 'numpy'
+    marker = (r'^[ \t]*(?:Parameters|Other Parameters|Returns|Yields|Raises|See Also|Notes|Examples)'
+              r'[ \t]*\n[ \t]*-{3,}[ \t]*$')
+    underline_regex = re.compile(r'^[ \t]*-{3,}[ \t]*$')
+    item_regex = re.compile(r'^[ \t]*(\*{0,2}\w+)(?:[ \t]*:(.*))?$')
+    sections = {'Parameters': 'params', 'Other Parameters': 'params',
+                'Returns': 'returns', 'Yields': 'returns'}
+
+    def parse(self, doc_lines, info):
+        explain = []
+        returns = []
+        section = None
+        section_indent = 0
+        underline = False
+        item = None
+        last = len(doc_lines) - 1
+        for i, line in enumerate(doc_lines):
+            if underline:
+                underline = False
+                continue
+            stripped = line.strip()
+            indent = len(line) - len(line.lstrip())
+            if stripped and i < last and self.underline_regex.match(doc_lines[i + 1]):
+                section = self.sections.get(stripped)
+                section_indent = indent
+                item = None
+                if section:
+                    underline = True
+                    continue
+            if section is None:
+                explain.append(line)
+                continue
+            if not stripped:
+                continue
+            if section == 'returns':
+                if indent == section_indent:
+                    returns.append([stripped])
+                elif returns:
+                    returns[-1].append(stripped)
+                continue
+            found = indent == section_indent and self.item_regex.match(line)
+            if found:
+                item = Argument(found.group(1), (found.group(2) or '').strip())
+                info.arguments.append(item)
+            elif item is not None:
+                item.describe = (item.describe + ' ' + stripped).lstrip()
+        if returns:
+            info.returns = '; '.join(': '.join([lines[0], ' '.join(lines[1:])]) if len(lines) > 1 else lines[0]
+                                     for lines in returns)
+        self.add_explain(info, explain)
+        return not info.arguments
+
+
+class DocstringFormats(object):
+    """
+    .. py:class:: DocstringFormats(formats=(), default='legacy')
+
+      A registry of docstring parsers. `detect` finds the style of a docstring
+      with a single search of the markers of all the registered formats,
+      compiled together into one regex, so the first marker of the docstring
+      decides. Without any marker it falls back to `default`.
+
+    """
+    def __init__(self, formats=(), default='legacy'):
+        self.formats = {}
+        self.order = []
+        self.default = default
+        self._detector = None
+        for doc_format in formats:
+            self.register(doc_format)
+
+    def register(self, doc_format):
+        if doc_format.name not in self.formats:
+            self.order.append(doc_format.name)
+        self.formats[doc_format.name] = doc_format
+        self._detector = None
+
+    def names(self):
+        return list(self.order)
+
+    def get(self, name):
+        return self.formats[name]
+
+    def detect(self, doc):
+        """
+        .. py:attribute:: detect()
+
+            Return the format of the docstring.
+           :param doc: The docstring
+           :type doc: string
+           :rtype: DocstringFormat
+        """
+        if self._detector is None:
+            markers = ['(?P<{}>{})'.format(name, self.formats[name].marker)
+                       for name in self.order if self.formats[name].marker]
+            self._detector = re.compile('|'.join(markers) or '(?!)', re.MULTILINE)
+        found = self._detector.search(doc)
+        return self.formats[found.lastgroup if found else self.default]
+
+
+DOCSTRING_FORMATS = DocstringFormats([LegacyFormat(), GoogleFormat(), NumpyFormat()])
+
+
+class Header(object):
+    """
+    .. py:class:: Header(body, indent, doc=None)
+
+      Position of a class or function body within the source: `body` is the
+      offset of the line that follows the header, `indent` the leading
+      whitespace of the body and `doc` the (start, end) offsets of the lines
+      of the existing docstring.
+
+    """
+    __slots__ = ('body', 'indent', 'doc')
+
+    def __init__(self, body, indent, doc=None):
+        self.body = body
+        self.indent = indent
+        self.doc = doc
+
+
+class LogicalLine(object):
+    """
+    .. py:class:: LogicalLine(first, keep_text=False)
+
+      What `SourceIndex` needs to know about a logical line, without keeping
+      its tokens: the first token, the `def`/`class` keyword token (after an
+      `async`), the last row, whether it consists of string literals only and
+      whether it ends with a block colon. The text of the strings is kept only
+      when `keep_text` is True.
+
+    """
+    __slots__ = ('first', 'keyword', 'end_row', 'strings_only', 'block_header', 'text')
+
+    def __init__(self, first, keep_text=False):
+        self.first = self.keyword = first
+        self.end_row = first[2][0]
+        self.strings_only = True
+        self.block_header = False
+        self.text = [] if keep_text else None
+
+
+class SourceIndex(object):
+    """
+    .. py:class:: SourceIndex(source)
+
+      Tokenize the source once and record the position of the module docstring
+      and of every class and function body. The headers are keyed by both the
+      line of the `def`/`class` keyword and the line of the first decorator,
+      since that's what `ast` reports as `lineno` for decorated objects.
+
+      The source isn't copied: the line offsets are kept in an array and the
+      tokens are summarized line by line, so that the index stays small next
+      to the source even for very large files.
+
+    """
+    def __init__(self, source):
+        self.source = source
+        self.line_offsets = array('L', [0])
+        position = source.find('\n')
+        while position != -1:
+            self.line_offsets.append(position + 1)
+            position = source.find('\n', position + 1)
+        self.line_offsets.append(len(source) + 1)
+        # Where the module starts (after the leading comments) and the
+        # (start, end, text) of the module docstring.
+        self.module_start = None
+        self.module_doc = None
+        self.headers = {}
+        self.scan()
+
+    def offset(self, row, col=0):
+        return self.line_offsets[row - 1] + col
+
+    def logical_lines(self):
+        """
+        .. py:attribute:: logical_lines()
+
+            Summarize the significant tokens of the source by logical line.
+           :rtype: generator of LogicalLine
+        """
+        import tokenize
+        from StringIO import StringIO
+        ignored = (tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT)
+        line = None
+        depth = count = 0
+        keep_text = True
+        last_row = 0
+        for token in tokenize.generate_tokens(StringIO(self.source).readline):
+            kind = token[0]
+            if kind in ignored:
+                continue
+            if kind == tokenize.ENDMARKER:
+                # No NEWLINE token after a last line without a line break (Python 2).
+                if line is not None:
+                    line.end_row = last_row
+                    yield line
+                break
+            last_row = token[3][0]
+            if kind == tokenize.NEWLINE:
+                line.end_row = token[3][0]
+                yield line
+                line = None
+                depth = count = 0
+                # Only the text of the first line (the module docstring) is needed.
+                keep_text = False
+                continue
+            if line is None:
+                line = LogicalLine(token, keep_text)
+            elif count == 1 and line.first[1] == 'async':
+                line.keyword = token
+            count += 1
+            if kind != tokenize.STRING:
+                line.strings_only = False
+                line.text = None
+            elif line.text is not None:
+                line.text.append(token[1])
+            line.block_header = False
+            if kind == tokenize.OP:
+                if token[1] in '([{':
+                    depth += 1
+                elif token[1] in ')]}':
+                    depth -= 1
+                elif token[1] == ':' and depth == 0:
+                    line.block_header = True
+
+    def docstring(self, line):
+        """
+        .. py:attribute:: docstring()
+
+            Return the (start, end, text) of the logical line if it consists of
+            string literals only, otherwise None.
+           :rtype: tuple
+        """
+        if line.strings_only:
+            return (self.offset(line.first[2][0]),
+                    self.offset(line.end_row + 1),
+                    ''.join(line.text) if line.text is not None else None)
+
+    def scan(self):
+        import tokenize
+        pending = []
+        decorator_line = None
+        for line in self.logical_lines():
+            first = line.first
+            row, col = first[2]
+            if self.module_start is None:
+                self.module_start = self.offset(row)
+                self.module_doc = self.docstring(line)
+            if pending:
+                header = Header(pending[0], self.source[self.offset(row):self.offset(row, col)],
+                                self.docstring(line))
+                for lineno in pending[1:]:
+                    self.headers[lineno] = header
+                pending = []
+            if first[1] == '@':
+                if decorator_line is None:
+                    decorator_line = row
+                continue
+            keyword = line.keyword
+            # Only the headers followed by an indented block have a body to document.
+            if keyword[0] == tokenize.NAME and keyword[1] in ('def', 'class') and line.block_header:
+                pending = [self.offset(line.end_row + 1), keyword[2][0]]
+                if decorator_line is not None:
+                    pending.append(decorator_line)
+            decorator_line = None
+        if self.module_start is None:
+            self.module_start = len(self.source)
+
 
 class Parser:
     """
@@ -28,48 +1068,75 @@ class Parser:
       documentation in form of RST formatting.
 
     """
-    def __init__(self):
+    def __init__(self, templates=None):
         """
         .. py:attribute:: __init__()
 
             Constructor of Parser objects
+           :param templates: The RST templates, read from the current directory by default
+           :type templates: TemplateRegistry
+           :param param_format: A raw frame of parameter line in RST formatting
+           :type param_format: string
+           :param doc_format: The style of the docstrings, `auto` to detect it per docstring
+           :type doc_format: string
            :rtype: None
         """
         self.file_name = None
-        self.next_iter = self.parser_iter = self.main_iter = self.file_contents = None
+        self.file_contents = None
+        self.templates = templates or TemplateRegistry()
+        self.stats = NullStats()
+        # When True the documented source is computed (in `new_source`) but never written.
+        self.dry_run = False
+        self.new_source = None
+        self.param_format = """   :param {name}: {describe}\n   :type {name}: {types}"""
+        self.returns_format = """   :returns: {returns}"""
+        self.formats = DOCSTRING_FORMATS
+        self.doc_format = 'auto'
+        # Set by `pars` when the whole file is already documented.
+        self.already_documented = False
+        self.committer = FileCommitter()
+        # The `ExtractionCache` shared with doc_extractor, if any.
+        self.extraction_cache = None
+        # The `SourceIndex` of `file_contents`, built by `source_index` when needed.
+        self.index = None
 
     def pars(self):
-        module = self.create_parser_obj(self.file_contents)
-        self.replacer(module)
+        self.templates.refresh()
+        with self.stats.phase('parse'):
+            extraction, module = load_extraction(self.file_contents, self.extraction_cache)
+        with self.stats.phase('check'):
+            self.already_documented = self.is_documented(extraction)
+        if self.already_documented:
+            self.new_source = self.file_contents
+            self.index = None
+            return False
+        # `module` is None when the extraction came from the cache, it isn't
+        # needed once there is an extraction.
+        edits, objects = self.collect_edits(module, extraction)
+        # The AST is by far the largest structure in memory, free it before writing.
+        del module, objects, extraction
+        self.index = None
+        changed = self.commit_edits(edits)
+        if changed and self.extraction_cache is not None and not self.dry_run:
+            # So that the next run of doc_extractor (or SimpleRST) finds the
+            # extraction of the written file.
+            with self.stats.phase('parse'):
+                load_extraction(self.splice(self.file_contents, edits), self.extraction_cache)
+        return changed
 
-    def create_refined_fileobj(self):
-        # This file object shouldn't be closed as it's gonna be used in other functions!!!
-        f = open(self.file_name)
-        refined_iter = dropwhile(lambda x: not x.strip(), f)
-        self.next_iter, self.parser_iter, self.main_iter, self.file_contents = tee(refined_iter, 4)
-        self.file_contents = ''.join(self.file_contents)
-        return (self.next_iter,
-                self.parser_iter,
-                self.main_iter,
-                self.file_contents)
-
-    def source_reader_filtered(self):
+    def read_source(self):
         """
-        .. py:attribute:: source_reader_filtered()
+        .. py:attribute:: read_source()
 
-            Read the content of input file by ignoring the escaped new line characters.
+            Read the input file once, the same buffer is used for parsing and
+            for rewriting the documentation.
            :rtype: string
-
         """
-        stack = deque()
-        next(self.next_iter)
-        for line, next_line in izip_longest(self.parser_iter, self.next_iter):
-            line = line.rstrip()
-            if line.endswith('\\'):
-                stack.append(line.strip('\\'))
-            else:
-                yield ''.join(stack) + line + '\n'
-                stack.clear()
+        with self.stats.phase('read'):
+            with open(self.file_name) as f:
+                self.file_contents = f.read()
+        self.stats.add('bytes_read', len(self.file_contents))
+        return self.file_contents
 
     def create_parser_obj(self, file_contents):
         """
@@ -91,324 +1158,413 @@ class Parser:
            (contains name, documentation, line number etc.) for function, class
            and attribute objects.
 
-           :rtype: dict
+           :rtype: generator of ObjectInfo
 
         .. note::
 
         """
-        def extracter(root_nod):
-            for node in root_nod.body:
-                if isinstance(node, ast.ClassDef):
-                    yield {
-                        "name": node.name,
-                        "lineno": node.lineno - 1,
-                        "docstring": ast.get_docstring(node),
-                        "type": 'class'}
-                    for sub_node in node.body:
-                        args_ = []
-                        if isinstance(sub_node, ast.FunctionDef):
-                            for arg in sub_node.args.args:
-                                    try:
-                                        args_.append(arg.id)
-                                    except AttributeError:
-                                        args_.extend([item.id for item in arg.elts if item.id != 'self'])
-
-                            yield {
-                                "name": sub_node.name,
-                                "lineno": sub_node.lineno - 1,
-                                "docstring": ast.get_docstring(sub_node),
-                                "type": 'attribute',
-                                "args": args_,
-                                "header": ''}
-                            for n in extracter(sub_node):
-                                yield n
-                elif isinstance(node, ast.FunctionDef):
-                    args_ = []
-                    for arg in node.args.args:
-                        try:
-                            args_.append(arg.id)
-                        except AttributeError:
-                            args_.extend([item.id for item in arg])
-                    yield {
-                        "name": node.name,
-                        "lineno": node.lineno - 1,
-                        "docstring": ast.get_docstring(node),
-                        "type": 'function',
-                        "args": args_}
-                    for n in extracter(node):
-                        yield n
-        return extracter(module)
-
-
-    def parse_doc(self, module):
+        return self.objects_info(extract(module).records)
+
+    def objects_info(self, records):
+        """
+        .. py:attribute:: objects_info()
+
+           Create the `ObjectInfo` of the records of an `Extraction`.
+           :rtype: generator of ObjectInfo
+        """
+        for type_, name, lineno, docstring, args, parent in records:
+            yield ObjectInfo(name, lineno - 1, type_, docstring, args)
+
+
+    def parse_doc(self, module, extraction=None):
         """
         .. py:attribute:: parse_doc()
 
 
            :param self:
            :type self:
+           :param extraction: The `Extraction` of `module`, if it's already known
+           :type extraction: `simplerst_extraction.Extraction`
            :rtype: UNKNOWN
 
         .. note::
 
         .. todo::
         """
-        objects_info = self.extract_info(module)
-        regex = re.compile(r'^\s*([^:]*)\(([^)]*)\):(.*)$', re.DOTALL)
+        if extraction is not None:
+            objects_info = self.objects_info(extraction.records)
+        else:
+            objects_info = self.extract_info(module)
+        formats = self.formats
+        fixed = None if self.doc_format == 'auto' else formats.get(self.doc_format)
         for parsed_docstring in objects_info:
-            doc = parsed_docstring.pop('docstring')
-            parsed_docstring["arguments"] = []
-            parsed_docstring["explain"] = ''
-            if doc and not doc.strip().startswith("@"):
+            doc = parsed_docstring.docstring
+            values = self.rendering(parsed_docstring)
+            if values is not None and self.arguments_are_current(values, parsed_docstring):
+                parsed_docstring.current = True
+                parsed_docstring.doc_length = doc.count('\n') + 1
+                yield [], parsed_docstring
+            elif values is not None:
+                doc_lines = doc.split('\n')
+                parsed_docstring.doc_length = len(doc_lines)
+                self.parse_rendering(values, parsed_docstring)
+                yield doc_lines, parsed_docstring
+            elif doc and not doc.strip().startswith("@"):
                 doc_lines = doc.split('\n')
-                doc_length = len(doc_lines)
-                parsed_docstring["doc_length"] = doc_length
-                indices = [i for i, line in enumerate(doc_lines) if regex.match(line)]
-                if not indices:
-                    indices = [0]
-                elif not indices[0] == 0:
-                    indices = [0] + indices
-                parts_ = ['\n'.join(doc_lines[i:j]) for i, j in zip(indices, indices[1:] + [None])]
-                match_arg_flag = True
-                for part in parts_:
-                    match_obj = regex.match(part)
-                    if match_obj:
-                        match_arg_flag = False
-                        name, types, describe = match_obj.group(1, 2, 3)
-                        parsed_docstring["arguments"].append(
-                            {'name': name, 'types': types, 'describe': describe})
-                    else:
-                        parsed_docstring["explain"] += '\n' + part
-                        if match_arg_flag:
-                            try:
-                                parsed_docstring['arguments'] = self.simple_arg_extracter(parsed_docstring['type'],
-                                                                                          parsed_docstring['args'])
-                            except KeyError:
-                                # Should be handle
-                                pass
+                parsed_docstring.doc_length = len(doc_lines)
+                doc_format = fixed or formats.detect(doc)
+                # The classes have no arguments.
+                if doc_format.parse(doc_lines, parsed_docstring) and parsed_docstring.args is not None:
+                    parsed_docstring.arguments[:0] = self.simple_arg_extracter(parsed_docstring.type,
+                                                                               parsed_docstring.args)
                 yield doc_lines, parsed_docstring
             else:
-                parsed_docstring['explain'] = ''
-                try:
-                    parsed_docstring['arguments'] = self.simple_arg_extracter(parsed_docstring['type'],
-                                                                              parsed_docstring['args'])
-                except KeyError:
-                    # Should be handle
-                    pass
-                parsed_docstring['doc_length'] = 0
+                if parsed_docstring.args is not None:
+                    parsed_docstring.arguments = self.simple_arg_extracter(parsed_docstring.type,
+                                                                           parsed_docstring.args)
                 yield [], parsed_docstring
 
     def simple_arg_extracter(self, obj_type, args):
 
         if obj_type in {'function', 'attribute'}:
-            return [{'name': i,
-                     'types': '',
-                     'describe': ''} for i in args if i != 'self']
+            return [Argument(i) for i in args if i != 'self']
         else:
-            return [{'name': '', 'types': '', 'describe': ''}]
+            return [Argument('')]
 
-    def create_rst(self, module):
+    def create_rst(self, module, extraction=None):
         """
         .. py:attribute:: create_rst()
 
 
            :param self:
            :type self:
+           :param extraction: The `Extraction` of `module`, if it's already known
+           :type extraction: `simplerst_extraction.Extraction`
            :rtype: UNKNOWN
 
         .. note::
 
         .. todo::
         """
-        parsed_docstring = self.parse_doc(module)
+        parsed_docstring = self.stats.iter('parse_doc', self.parse_doc(module, extraction))
+        param_format = self.param_format
         for doc_lines, doc in parsed_docstring:
-            name, lineno, type_, explain, arguments, doc_length = itemgetter(
-                'name',
-                'lineno',
-                'type',
-                'explain',
-                'arguments',
-                'doc_length')(doc)
-            params = '\n'.join([self.param_format.format(**i) for i in arguments])
-            if type_ == 'function':
-                args = doc['args']
-                with open('temp_function.rst') as fi:
-                    empty_rst = fi.read()
-                full_rst = empty_rst.format(**{
-                    'args': args,
-                    'name': name,
-                    'lineno': lineno,
-                    'type': type_,
-                    'explain': explain,
-                    'params': params,
-                    'self.file_name': self.file_name,
-                    'return': 'UNKNOWN',
-                    'note': '',
-                    'example': '',
-                    'todo': ''})
-            elif type_ == 'class':
-                with open('temp_class.rst') as fi:
-                    empty_rst = fi.read()
-                full_rst = empty_rst.format(**{
-                    'name': name,
-                    'lineno': lineno,
-                    'type': type_,
-                    'explain': explain,
-                    'params': params,
-                    'args': '',
-                    'self.file_name': self.file_name,
-                    'return': 'UNKNOWN',
-                    'note': '',
-                    'example': '',
-                    'todo': ''})
-            elif type_ == 'attribute':
-                with open('attribute.rst') as fi:
-                    empty_rst = fi.read()
-                full_rst = empty_rst.format(**{
-                    'name': name,
-                    'lineno': lineno,
-                    'type': type_,
-                    'explain': explain,
-                    'params': params,
-                    'args': '',
-                    'self.file_name': self.file_name,
-                    'return': 'UNKNOWN',
-                    'note': '',
-                    'example': '',
-                    'todo': ''})
-            yield lineno + 1, full_rst, doc_length, doc_lines
-
-    def replacer(self, module, doc_flag=False, initial=False, whitespace=None):
+            if doc.current:
+                # Already rendered, there is nothing to replace.
+                yield doc.lineno + 1, None, doc.doc_length, doc_lines, doc
+                continue
+            params = '\n'.join([param_format.format(name=i.name, types=i.types, describe=i.describe)
+                                for i in doc.arguments])
+            if doc.returns:
+                params += '\n' + self.returns_format.format(returns=doc.returns)
+            fields = self.template_fields(doc)
+            fields['explain'] = doc.explain
+            fields['params'] = params
+            full_rst = self.templates.get(doc.type).render(fields)
+            yield doc.lineno + 1, full_rst, doc.doc_length, doc_lines, doc
+
+    def template_fields(self, doc):
         """
-        .. py:attribute:: replacer()
-            Replace the existing document (if it exist) or adding new document (if it hasn't doc)
+        .. py:attribute:: template_fields()
+
+            The fields of the template of a record that don't depend on its
+            docstring, i.e. all of them apart from `explain` and `params`.
+           :rtype: dict
+        """
+        return {'args': doc.args if doc.type == 'function' else '',
+                'name': doc.name,
+                'lineno': doc.lineno,
+                'type': doc.type,
+                'self.file_name': self.file_name,
+                'return': 'UNKNOWN',
+                'note': '',
+                'example': '',
+                'todo': ''}
+
+    def is_current(self, doc):
+        """
+        .. py:attribute:: is_current()
+
+            Check whether the docstring of a record, as given by the AST, is
+            already a rendering of its template for this object: same name,
+            type and signature, and the parameter lines are those of the
+            arguments.
+           :rtype: boolean
+        """
+        values = self.rendering(doc)
+        return values is not None and self.arguments_are_current(values, doc)
+
+    def arguments_are_current(self, values, doc):
+        """
+        .. py:attribute:: arguments_are_current()
+
+            Check whether the signature and the parameter lines of a rendering,
+            given by the `values` of its template fields, are those of the
+            arguments.
+           :rtype: boolean
+        """
+        if values.get('args', '') != '{}'.format(self.template_fields(doc)['args']):
+            return False
+        if doc.args is None:
+            return True
+        names = set(name for kind, name, value in RENDERED_ARG_REGEX.findall(values.get('params', ''))
+                    if kind == 'param')
+        return names == set(arg for arg in doc.args if arg != 'self')
+
+    def rendering(self, doc):
+        """
+        .. py:attribute:: rendering()
+
+            Match the docstring of a record against its template for this
+            object, regardless of its arguments (the signature and the
+            parameter lines).
+           :rtype: dict (the values of the free fields) or None
+        """
+        if not doc.docstring:
+            return None
+        fields = self.template_fields(doc)
+        del fields['args']
+        return self.templates.get(doc.type).match(doc.docstring, fields)
+
+    def parse_rendering(self, values, doc):
+        """
+        .. py:attribute:: parse_rendering()
 
-           :param doc_flag: A boolean value for controlling the different states
-           :type doc_flag: boolean
-           :param initial: A boolean value for controlling the different states
-           :type initial: boolean
+            Set the `explain`, `arguments` and `returns` of a record from the
+            `values` of its outdated rendering (e.g. an argument was removed),
+            keeping the lines of the arguments that are still there.
            :rtype: None
+        """
+        # The fields are matched lazily, so the explanation may end up in `params`.
+        text = values.get('explain', '') + '\n' + values.get('params', '')
+        fields = {}
+        for kind, name, value in RENDERED_ARG_REGEX.findall(text):
+            field = fields.setdefault(name, {'param': '', 'type': ''})
+            field[kind] = field[kind] or value
+        explain = [line for line in text.split('\n')
+                   if not RENDERED_ARG_REGEX.match(line) and not RENDERED_RETURNS_REGEX.match(line)]
+        doc.explain = '\n'.join(explain).rstrip()
+        doc.arguments = []
+        for arg in doc.args:
+            if arg != 'self':
+                field = fields.get(arg, {})
+                doc.arguments.append(Argument(arg, field.get('type', ''), field.get('param', '')))
+        returns = RENDERED_RETURNS_REGEX.search(text)
+        doc.returns = returns.group(1) if returns else None
+
+    def module_is_current(self, doc):
+        """
+        .. py:attribute:: module_is_current()
+
+            Check whether the module docstring is already a rendering of the
+            module template for this file.
+           :rtype: boolean
+        """
+        return bool(doc) and self.templates.get('module').match(doc, {
+            'file_name': os.path.basename(self.file_name),
+            'signature': SIGNATURE}) is not None
+
+    def is_documented(self, extraction):
+        """
+        .. py:attribute:: is_documented()
+
+            Check, from the extracted docstrings only, whether the module
+            docstring and the docstrings of all the classes and functions are
+            already renderings of their templates, in which case the file
+            needs no rewrite. The objects without a body to document (e.g.
+            ``def f(): return 1``) are looked up in the `source_index`.
+           :param extraction: The `Extraction` of `file_contents`
+           :type extraction: `simplerst_extraction.Extraction`
+           :rtype: boolean
+        """
+        if not self.module_is_current(extraction.module_doc):
+            return False
+        objects = documented = 0
+        for doc in self.objects_info(extraction.records):
+            objects += 1
+            if self.is_current(doc):
+                documented += 1
+            elif doc.lineno + 1 in self.source_index().headers:
+                return False
+        self.stats.add('objects', objects)
+        self.stats.add('current', documented)
+        return True
+
+    def source_index(self):
+        """
+        .. py:attribute:: source_index()
+
+            Return the `SourceIndex` of `file_contents`, built once per source.
+           :rtype: SourceIndex
+        """
+        if self.index is None or self.index.source is not self.file_contents:
+            with self.stats.phase('index'):
+                self.index = SourceIndex(self.file_contents)
+        return self.index
+
+    def replacer(self, module):
+        """
+        .. py:attribute:: replacer()
+            Replace the existing document (if it exist) or adding new document (if it hasn't doc)
+           :rtype: boolean (whether the documentation changed)
 
         .. note::
 
         .. todo::
         """
-        offset, module_doc, refined_iter = self.extract_module_doc()
-        module_doc = self.module_doc_to_rst(module_doc)
-        tempfile = NamedTemporaryFile(delete=False)
-        tempfile.write(module_doc)
-        rst_iterator = self.create_rst(module)
-        lineno, full_rst, doc_length, doc_lines = next(rst_iterator)
-        for index, line in enumerate(refined_iter, 1 + offset):
-            # If we encounter a class, function or attribute header
-            strip_line = line.strip()
-            new_strip = strip_line.replace('"""', '')
-            if new_strip:
-                strip_line = new_strip
-            if index == lineno:
-                # refuse of matching he decorators.
-                if strip_line.startswith('@'):
-                    tempfile.write(line)
-                    lineno += 1
-                    continue
-                if not whitespace:
-                    whitespace = self.whitespace_regex.search(line).group(1)
-                # If object header got finished in this line (existence of `:` at the end of line)
-                if self.check_header(strip_line):
-                    tempfile.write(line)
-                    # Preparing the leading whitespace
-                    if '\t' in whitespace:
-                        whitespace += "\t"
-                    else:
-                        whitespace += "    "
-                    # If the object hasn't any doc by itself we write the full_rst and make the
-                    # doc_flag True in order to be use in next steps
-                    if doc_length == 0:
-                        tempfile.write(
-                            ''.join([
-                                whitespace,
-                                '"""\n',
-                                '\n'.join([whitespace + l.rstrip() if l.strip() else l for l in full_rst.split('\n')]),
-                                whitespace,
-                                '"""\n']))
-                        doc_flag = True
-
-                    else:
-                        # If object has doc write the full_rst and make the doc_flag False
-                        tempfile.write(
-                            ''.join([
-                                whitespace,
-                                '"""\n',
-                                '\n'.join([whitespace + l.rstrip() if l.strip() else l for l in full_rst.split('\n')]),
-                                whitespace,
-                                '"""\n']))
-                        doc_flag = False
-
-                    # clear the previous white space in order to be reconstruct for next objects.
-                    whitespace = None
-                    # making initial True means we have written the documentation
-                    initial = True
-                    try:
-                        # Preserve the documentation and iterate over rst_iterator
-                        pre_doc_lines = doc_lines
-                        lineno, full_rst, doc_length, doc_lines = next(rst_iterator)
-                    except StopIteration:
-                        pass
-                elif line.count('(') != line.count(')'):
-                        # If we encounter a line and the line doesn't end with `:` means that header
-                        # has been too long and has been divided to multiple parts.
-                        tempfile.write(line)
-                        lineno += 1
-                else:
-                    tempfile.write(line)
-
-            # If the index != lineno and initial be True means that we have written the doc and still
-            # we are in object body.
-            elif initial:
-                # If doc_flag is True means that object doesn't get documented, so we can write the next lines incautiously.
-                if doc_flag:
-                    tempfile.write(line)
-                    initial = False
-                # otherwise if the line is a whitespace we write it.
-                elif not strip_line:
-                    tempfile.write(line)
-                # Else if line in not in previous doc lines we we write it
-                elif strip_line not in map(str.strip, pre_doc_lines + ['"""']):
-                    tempfile.write(line)
-            # If line is not a the header of an object and initial is not True we just write the line.
-            else:
-                tempfile.write(line)
-            # Replace the temporary file with target file.
-        shutil.move(tempfile.name, self.file_name)
-
-    def check_header(self, line):
-        if '#' in line:
-            line = line.split('#')[0].strip()
-            return line.endswith(':')
-        return line.endswith(':')
-
-    def extract_module_doc(self):
-        shebang_lines = []
-        doc_lines = []
-        counter = 0
-        for line in self.main_iter:
-            strip_line = line.strip()
-            if strip_line.startswith('#'):
-                shebang_lines.append(line)
-            elif strip_line.startswith('"""'):
-                counter += 1
-            elif counter % 2 == 0:
-                return (len(doc_lines) + counter,
-                        doc_lines,
-                        chain(shebang_lines + [line], self.main_iter))
-            else:
-                doc_lines.append(line)
+        edits, objects = self.collect_edits(module)
+        return self.commit_edits(edits)
+
+    def rewrite(self, module):
+        """
+        .. py:attribute:: rewrite()
+
+            Create the documented version of `file_contents`, without touching
+            the file.
+           :param module: The parsed `file_contents`
+           :type module: `ast.Module`
+           :rtype: tuple of the new source and the list of `ObjectInfo`
+        """
+        edits, objects = self.collect_edits(module)
+        with self.stats.phase('splice'):
+            return self.splice(self.file_contents, edits), objects
+
+    def collect_edits(self, module, extraction=None):
+        """
+        .. py:attribute:: collect_edits()
+
+            Compute the (start, end, text) replacements of the documentation of
+            `file_contents`, sorted by offset. The positions of the headers and
+            docstrings are taken from a single tokenize pass over the source.
+           :param module: The parsed `file_contents`, only used when there is no `extraction`
+           :type module: `ast.Module`
+           :param extraction: The `Extraction` of `file_contents`, if it's already known
+           :type extraction: `simplerst_extraction.Extraction`
+           :rtype: tuple of the edits and the list of `ObjectInfo`
+        """
+        if extraction is None:
+            extraction = extract(module)
+        source = self.file_contents
+        index = self.source_index()
+        if index.module_doc:
+            start, end, text = index.module_doc
+            # Drop the blank lines after the docstring, `module_doc_to_rst` adds its own.
+            while end < len(source) and source[end] == '\n':
+                end += 1
+            module_doc = self.string_body(text).splitlines(True)
+        else:
+            start = end = index.module_start
+            module_doc = []
+        # Leading blank lines are dropped, leading comments (shebang, encoding) are kept.
+        if not source[:start].strip():
+            start = 0
+        edits = []
+        if not self.module_is_current(extraction.module_doc):
+            edits.append((start, end, self.module_doc_to_rst(module_doc)))
+        objects = []
+        current = 0
+        rendered = self.stats.iter('create_rst', self.create_rst(module, extraction))
+        for lineno, full_rst, doc_length, doc_lines, doc in rendered:
+            header = index.headers.get(lineno)
+            objects.append(doc)
+            if doc.current:
+                doc.rst = doc.docstring
+                current += 1
+                continue
+            doc.rst = full_rst
+            doc.replaced = header is not None
+            if header is None:
+                continue
+            start, end = header.doc[:2] if header.doc else (header.body, header.body)
+            edits.append((start, end, self.indent_rst(full_rst, header.indent)))
+        edits.sort(key=itemgetter(0))
+        self.stats.add('objects', len(objects))
+        self.stats.add('current', current)
+        return edits, objects
+
+    def commit_edits(self, edits):
+        """
+        .. py:attribute:: commit_edits()
+
+            Apply the edits to the file, or in `dry_run` mode keep the new
+            source in `new_source`. The file is left untouched when the edits
+            don't change anything.
+           :rtype: boolean (whether the documentation changed)
+        """
+        source = self.file_contents
+        # The size of the replaced or replacing text, whichever is larger.
+        changed = sum(max(len(text), end - start) for start, end, text in edits if source[start:end] != text)
+        self.stats.add('bytes_changed', changed)
+        if self.dry_run:
+            with self.stats.phase('splice'):
+                self.new_source = self.splice(source, edits)
+            return self.new_source != source
+        if not changed:
+            return False
+        self.write_edits(edits)
+        return True
+
+    def splice(self, source, edits):
+        """
+        .. py:attribute:: splice()
+
+            Apply the sorted (start, end, text) edits to the source in one pass.
+           :rtype: string
+        """
+        parts = []
+        position = 0
+        for start, end, text in edits:
+            parts.append(source[position:start])
+            parts.append(text)
+            position = end
+        parts.append(source[position:])
+        return ''.join(parts)
+
+    def indent_rst(self, full_rst, whitespace):
+        return ''.join([
+            whitespace,
+            '"""\n',
+            '\n'.join([whitespace + l.rstrip() if l.strip() else l for l in full_rst.split('\n')]),
+            whitespace,
+            '"""\n'])
+
+    def string_body(self, text):
+        """
+        .. py:attribute:: string_body()
+
+            Strip the prefix and the quotes of a string literal, and the new
+            line that follows the opening quotes.
+           :rtype: string
+        """
+        text = text.lstrip('rRuUbB')
+        quote = 3 if text[:3] in ('"""', "'''") else 1
+        text = text[quote:-quote]
+        return text[1:] if text.startswith('\n') else text
+
+    def write_edits(self, edits):
+        """
+        .. py:attribute:: write_edits()
+
+            Stream the edited source to the target file through `committer`.
+            The unchanged parts are written straight from the
+            `file_contents` buffer, so the new source is never held in memory.
+           :rtype: None
+        """
+        source = self.file_contents
+        with self.stats.phase('write'):
+            with self.committer.open(self.file_name) as output:
+                position = 0
+                for start, end, text in edits:
+                    output.write(buffer(source, position, start - position))
+                    output.write(text)
+                    position = end
+                output.write(buffer(source, position))
+                written = output.tell()
+        self.stats.add('bytes_written', written)
 
     def module_doc_to_rst(self, module_doc):
         module_doc = ''.join(module_doc).replace('"""', '')
-        with open('module.rst') as fi:
-            empty_rst = fi.read()
-        full_rst = empty_rst.format(**{
+        full_rst = self.templates.get('module').render({
             'file_name': os.path.basename(self.file_name),
             'explanation': module_doc,
             'signature': SIGNATURE})
@@ -420,11 +1576,11 @@ class Manager(Parser):
         """
         .. py:attribute:: __init__()
 
-           :param param_format: A raw frame of parameter line in RST formatting
-           :type param_format: string
-           :param whitespace_regex: A regex for extracting the leading
-            whitespace from code lines
-           :type: regex object
+           :param args: The parsed command line arguments
+           :type args: `argparse.Namespace`
+           :param stats: The statistics collector, by default a `Stats` when
+            `args.stats` is set and a `NullStats` otherwise
+           :type stats: NullStats
 
            :rtype: UNKNOWN
 
@@ -432,17 +1588,102 @@ class Manager(Parser):
 
         .. todo::
         """
-        # call the parent's constructor
-        Parser().__init__()
         # get arguments
         self.args = kwargs['args']
+        # call the parent's constructor
+        template_dir = getattr(self.args, 't', None)
+        if not template_dir and not os.path.exists(TEMPLATE_FILES['function']):
+            # Run from anywhere, e.g. as the installed `simplerst` script.
+            template_dir = default_template_dir()
+        Parser.__init__(self, TemplateRegistry(template_dir))
         self.directory_path, self.file_name = self.get_args()
-        self.whitespace_regex = re.compile(r"^(\s*).*")
-        self.param_format = """   :param {name}: {describe}\n   :type {name}: {types}"""
+        self.changed_since = getattr(self.args, 'changed_since', None)
+        self.staged = getattr(self.args, 'staged', False)
+        self.excludes = getattr(self.args, 'exclude', None) or []
+        self.gitignore = getattr(self.args, 'gitignore', False)
+        if (self.changed_since or self.staged) and not (self.directory_path or self.file_name):
+            self.directory_path = '.'
+        self.stats = kwargs.get('stats') or (
+            Stats() if getattr(self.args, 'stats', None) or getattr(self.args, 'report', None) else NullStats())
+        # Where the messages are printed, and the `RunReport` of `-report`.
+        self.messages = sys.stdout
+        self.report = None
+        self.diff = getattr(self.args, 'diff', False)
+        self.doc_format = getattr(self.args, 'format', None) or 'auto'
+        self.dry_run = self.diff or getattr(self.args, 'check', False)
+        self.committer = FileCommitter(getattr(self.args, 'batch', False), getattr(self.args, 'fsync', None) or 'none')
+        extract_cache = getattr(self.args, 'extract_cache', None)
+        if extract_cache:
+            self.extraction_cache = ExtractionCache(extract_cache)
+        # The files whose documentation is (or would be, in dry run) updated.
+        self.changed_files = []
+        self.current_files = []
+        cache_path = getattr(self.args, 'c', None)
+        self.cache = FileCache(cache_path, self.fingerprint()) if cache_path else None
 
     def get_args(self):
         return attrgetter('d', 'f')(self.args)
 
+    def fingerprint(self):
+        """
+        .. py:attribute:: fingerprint()
+
+            A hash of everything, apart from the source itself, that the output
+            depends on: the templates, the parameter formats, the docstring style
+            and the signature.
+           :rtype: string
+        """
+        import hashlib
+        sha = hashlib.sha1(SIGNATURE + self.param_format + self.returns_format + self.doc_format)
+        for name in sorted(TEMPLATE_FILES):
+            sha.update(self.templates.get(name).text)
+        return sha.hexdigest()
+
+    def is_up_to_date(self, file_name):
+        """
+        .. py:attribute:: is_up_to_date()
+
+            Check whether the file is unchanged since the last run which used
+            the same cache, in which case documenting it again is not needed.
+           :param file_name: Path of the python file
+           :type file_name: string
+           :rtype: boolean
+        """
+        if self.cache is None:
+            return False
+        digest = self.cache.get(file_name)
+        return digest is not None and digest == file_digest(file_name)
+
+    def record(self, file_name):
+        if self.cache is not None and not self.dry_run:
+            self.cache.set(file_name, file_digest(self.committer.path(file_name)))
+
+    def result_message(self, name, changed):
+        """
+        .. py:attribute:: result_message()
+
+            Close the statistics of a documented file and return its message,
+            along with its diff in `-diff` mode.
+           :param name: The file name to display
+           :type name: string
+           :param changed: Whether the documentation of the file changed
+           :type changed: boolean
+           :rtype: string
+        """
+        if self.already_documented:
+            self.stats.end_file('current')
+            self.current_files.append(self.file_name)
+            return 'File " {} " is already documented'.format(name)
+        self.stats.end_file('documented')
+        if changed:
+            self.changed_files.append(self.file_name)
+        if not self.dry_run:
+            return 'File " {} " gets documented'.format(name)
+        message = 'File " {} " {}'.format(name, 'would be documented' if changed else 'is up to date')
+        if self.diff and changed:
+            message += '\n' + unified_diff(self.file_contents, self.new_source, self.file_name).rstrip('\n')
+        return message
+
     @property
     def _file_name(self):
         return self.file_name
@@ -457,30 +1698,528 @@ class Manager(Parser):
 
             Parse the input arguments and call the `pars()` function on file names
             based on the input arguments.
-           :rtype: None
+           :rtype: int (the exit status, 1 if a file would change in `-check`
+            or `-diff` mode, 0 otherwise)
 
         .. note::
 
         .. todo::
         """
-        if self.file_name:
-            self.create_refined_fileobj()
-            self.pars()
-            print 'File " {} " gets documented'.format(os.path.basename(self.file_name))
+        report_format = getattr(self.args, 'report', None)
+        if report_format:
+            self.open_report(report_format, getattr(self.args, 'report_file', None))
+        try:
+            status = self.process()
+        except BaseException as e:
+            if self.report is not None:
+                self.close_report(aborted=True, error={'type': type(e).__name__, 'message': str(e)})
+            raise
+        if self.report is not None:
+            self.close_report(exit_status=status)
+        return status
+
+    def process(self):
+        """
+        .. py:attribute:: process()
+
+            Document the file or the directory given on the command line (or
+            serve or watch them) and return the exit status of `run`.
+           :rtype: int
+        """
+        if getattr(self.args, 's', None):
+            self.serve(self.args.s, getattr(self.args, 'timeout', None))
+        elif self.file_name:
+            self.stats.start_file(self.file_name)
+            if self.is_up_to_date(self.file_name):
+                self.stats.end_file('skipped')
+                print >> self.messages, 'File " {} " gets skipped'.format(os.path.basename(self.file_name))
+            else:
+                try:
+                    self.read_source()
+                    changed = self.pars()
+                except BaseException:
+                    self.committer.rollback()
+                    raise
+                self.committer.commit()
+                self.record(self.file_name)
+                print >> self.messages, self.result_message(os.path.basename(self.file_name), changed)
         elif self.directory_path:
-            for path, dirs, files in os.walk(self.directory_path):
-                for file_name in fnmatch.filter(files, '*.py'):
-                    self.file_name = '{}/{}'.format(path, file_name)
-                    try:
-                        self.create_refined_fileobj()
-                        self.pars()
-                    except (StopIteration, TypeError, IndentationError, SyntaxError) as e:
-                        print "*** File {} gets escaped. ***\n*** {} ***".format(self.file_name, e)
-                    else:
-                        print 'File " {} " gets documented'.format(self.file_name)
+            jobs = getattr(self.args, 'j', None) or 1
+            if jobs > 1:
+                messages = self.run_parallel(jobs)
+            else:
+                messages = (self.document_file(file_name) for file_name in self.iter_py_files())
+            try:
+                for message in messages:
+                    print >> self.messages, message
+            except BaseException:
+                # In batch mode none of the files gets replaced.
+                self.committer.rollback()
+                raise
+            self.committer.commit()
+            if self.current_files:
+                print >> self.messages, '*** {} file(s) already documented, left untouched ***'.format(
+                    len(self.current_files))
+        if self.cache is not None and not self.dry_run:
+            self.cache.save()
+        if getattr(self.args, 'watch', False) and (self.file_name or self.directory_path):
+            self.watch(getattr(self.args, 'interval', None) or 1, getattr(self.args, 'debounce', None) or 0)
+        if getattr(self.args, 'stats', None):
+            self.report_stats(self.args.stats)
+        return 1 if self.dry_run and self.changed_files else 0
 
+    def open_report(self, report_format, output=None):
+        """
+        .. py:attribute:: open_report()
 
-if __name__ == "__main__":
+            Start streaming the records of the finished files to `output`. When
+            the report goes to the standard output the messages are printed
+            on the standard error instead.
+           :param report_format: ``json`` or ``jsonl``
+           :type report_format: string
+           :param output: A file name, or `-` (or None) for the standard output
+           :type output: string
+           :rtype: RunReport
+        """
+        if output and output != '-':
+            stream = open(output, 'w')
+        else:
+            stream = sys.stdout
+            self.messages = sys.stderr
+        self.report = RunReport(stream, report_format)
+        self.stats.hooks.append(self.report)
+        return self.report
+
+    def close_report(self, **extra):
+        self.report.close(self.stats.totals(), **extra)
+        if self.report.output is not sys.stdout:
+            self.report.output.close()
+
+    def report_stats(self, output):
+        """
+        .. py:attribute:: report_stats()
+
+            Print the summary of the statistics, or dump them as JSON when
+            `output` is a file name.
+           :param output: A file name, or `-` (or None) for the summary
+           :type output: string
+           :rtype: None
+        """
+        if output and output != '-':
+            import json
+            with open(output, 'w') as f:
+                json.dump(self.stats.as_dict(), f, indent=2, sort_keys=True)
+        else:
+            print >> self.messages, self.stats.summary()
+
+    def iter_py_files(self):
+        """
+        .. py:attribute:: iter_py_files()
+
+            Walk the `directory_path` and yield the path of python files in the
+            same order that the serial run visits them. In `-changed_since` and
+            `-staged` modes the files are asked to git instead.
+           :rtype: generator
+        """
+        if self.changed_since or self.staged:
+            for relative in self.git_changed_files():
+                if not self.is_excluded(relative):
+                    yield '{}/{}'.format(self.directory_path, relative)
+            return
+        ignored = self.git_ignored() if self.gitignore else frozenset()
+        for path, dirs, files in os.walk(self.directory_path):
+            relative = os.path.relpath(path, self.directory_path)
+            prefix = '' if relative == '.' else relative.replace(os.sep, '/') + '/'
+            dirs[:] = [d for d in dirs
+                       if d != '.git' and prefix + d + '/' not in ignored and not self.is_excluded(prefix + d)]
+            for file_name in fnmatch.filter(files, '*.py'):
+                if prefix + file_name not in ignored and not self.is_excluded(prefix + file_name):
+                    yield '{}/{}'.format(path, file_name)
+
+    def is_excluded(self, relative):
+        """
+        .. py:attribute:: is_excluded()
+
+            Check the path (relative to `directory_path`) and its base name
+            against the `-exclude` glob patterns.
+           :rtype: boolean
+        """
+        name = relative.rsplit('/', 1)[-1]
+        return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern)
+                   for pattern in self.excludes)
+
+    def git(self, *args):
+        """
+        .. py:attribute:: git()
+
+            Run a git command in `directory_path` and return its output lines,
+            or its NUL separated fields with `-z` (the file names are quoted
+            otherwise, when they aren't ASCII).
+           :rtype: list of strings
+        """
+        import subprocess
+        try:
+            process = subprocess.Popen(('git',) + args, cwd=self.directory_path,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output, error = process.communicate()
+        except OSError as e:
+            output, error = '', str(e)
+        else:
+            if not process.returncode:
+                return [line for line in output.split('\0' if '-z' in args else '\n') if line]
+        raise SystemExit("*** git {} failed in {}. ***\n*** {} ***".format(
+            args[0], self.directory_path, error.strip().split('\n')[0]))
+
+    def git_changed_files(self):
+        """
+        .. py:attribute:: git_changed_files()
+
+            The python files (relative to `directory_path`) that are staged with
+            `-staged`, or that changed since the `-changed_since` revision,
+            including the untracked ones.
+           :rtype: list of strings
+        """
+        # Fails early, and clearly, outside of a git work tree.
+        self.git('rev-parse', '--git-dir')
+        if self.staged:
+            names = self.git('diff', '--name-only', '-z', '--relative', '--diff-filter=ACMR', '--cached',
+                             '--', '*.py')
+        else:
+            names = self.git('diff', '--name-only', '-z', '--relative', '--diff-filter=ACMR',
+                             self.changed_since, '--', '*.py')
+            names += self.git('ls-files', '-z', '--others', '--exclude-standard', '--', '*.py')
+        return sorted(name for name in set(names) if os.path.isfile(os.path.join(self.directory_path, name)))
+
+    def git_ignored(self):
+        """
+        .. py:attribute:: git_ignored()
+
+            The files and directories (with a trailing slash) ignored by git,
+            relative to `directory_path`. Empty when it isn't in a git work tree.
+           :rtype: frozenset
+        """
+        try:
+            return frozenset(self.git('ls-files', '-z', '--others', '--ignored', '--exclude-standard',
+                                      '--directory'))
+        except SystemExit:
+            return frozenset()
+
+    def document_file(self, file_name):
+        """
+        .. py:attribute:: document_file()
+
+            Document one file of a directory run and return the message that
+            should be printed for it.
+           :param file_name: Path of the python file
+           :type file_name: string
+           :rtype: string
+        """
+        self.file_name = file_name
+        self.stats.start_file(file_name)
+        if self.is_up_to_date(file_name):
+            self.stats.end_file('skipped')
+            return 'File " {} " gets skipped'.format(self.file_name)
+        try:
+            self.read_source()
+            changed = self.pars()
+        except (StopIteration, TypeError, IndentationError, SyntaxError) as e:
+            self.stats.end_file('escaped', e)
+            return "*** File {} gets escaped. ***\n*** {} ***".format(self.file_name, e)
+        self.record(file_name)
+        return self.result_message(self.file_name, changed)
+
+    def snapshot(self, files=None):
+        """
+        .. py:attribute:: snapshot()
+
+            Return the (mtime, size) of the files, by default of every file that
+            `run` documents.
+           :rtype: dict
+        """
+        if files is None:
+            # `file_name` is the last documented file in directory mode.
+            single = getattr(self.args, 'f', None)
+            files = [single] if single else self.iter_py_files()
+        snapshot = {}
+        for file_name in files:
+            try:
+                info = os.stat(file_name)
+            except OSError:
+                # Removed in the meantime.
+                continue
+            snapshot[file_name] = (info.st_mtime, info.st_size)
+        return snapshot
+
+    def modified_files(self, snapshot):
+        """
+        .. py:attribute:: modified_files()
+
+            Take a new snapshot and return the files which have been created or
+            modified since `snapshot`, which gets updated.
+           :rtype: set
+        """
+        current = self.snapshot()
+        modified = set(name for name, entry in current.iteritems() if snapshot.get(name) != entry)
+        snapshot.clear()
+        snapshot.update(current)
+        return modified
+
+    def watch(self, interval=1, debounce=0):
+        """
+        .. py:attribute:: watch()
+
+            Poll the (mtime, size) of the files every `interval` seconds and
+            document the modified ones, until a SIGINT/SIGTERM. A burst of saves
+            is documented once, when the files have been left alone for
+            `debounce` seconds. The files written by the watcher itself get
+            their new snapshot right away, so they don't trigger another run.
+           :param interval: Seconds between two polls
+           :type interval: float
+           :param debounce: Seconds without modifications before documenting
+           :type debounce: float
+           :rtype: None
+        """
+        import threading
+        stopped = threading.Event()
+
+        def stop(signum, frame):
+            stopped.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        snapshot = self.snapshot()
+        print >> self.messages, 'Watching " {} "'.format(getattr(self.args, 'f', None) or self.directory_path)
+        self.messages.flush()
+        while not stopped.wait(interval):
+            modified = self.modified_files(snapshot)
+            if not modified:
+                continue
+            while debounce and not stopped.wait(debounce):
+                more = self.modified_files(snapshot)
+                if not more:
+                    break
+                modified |= more
+            if stopped.is_set():
+                break
+            documented = []
+            for file_name in sorted(modified):
+                if file_name in snapshot:
+                    print >> self.messages, self.document_file(file_name)
+                    documented.append(file_name)
+            self.committer.commit()
+            snapshot.update(self.snapshot(documented))
+            if self.cache is not None and not self.dry_run:
+                self.cache.save()
+            self.messages.flush()
+
+    def run_parallel(self, jobs):
+        """
+        .. py:attribute:: run_parallel()
+
+            Document the files of `directory_path` in a pool of `jobs` worker
+            processes. The messages are yielded in walk order, so the output is
+            identical to a serial run.
+           :param jobs: Number of worker processes
+           :type jobs: int
+           :rtype: generator
+        """
+        file_names = list(self.iter_py_files())
+        chunksize = max(1, len(file_names) // (jobs * 4))
+        import multiprocessing
+        aborted = multiprocessing.Event()
+        pool = multiprocessing.Pool(jobs, _init_worker, (self.args, aborted))
+        # The chunks are made here rather than by `imap`, whose iterator over
+        # chunks ends at the first error, dropping the results still to come.
+        chunks = [file_names[i:i + chunksize] for i in range(0, len(file_names), chunksize)]
+        results = pool.imap(_document_worker, chunks)
+        try:
+            for chunk in results:
+                for result in chunk:
+                    if 'error' in result:
+                        raise result['error']
+                    if result['digest'] is not None:
+                        self.cache.set(result['file_name'], result['digest'])
+                    if result['stats'] is not None:
+                        self.stats.merge(result['stats'])
+                    if result['changed']:
+                        self.changed_files.append(result['file_name'])
+                    if result['current']:
+                        self.current_files.append(result['file_name'])
+                    self.committer.pending.extend(result['pending'])
+                    yield result['message']
+            pool.close()
+        except BaseException:
+            # Let the workers finish the files in flight (they skip the others)
+            # rather than kill them in the middle of a write.
+            aborted.set()
+            pool.close()
+            try:
+                self.discard_results(results)
+            except BaseException:
+                pool.terminate()
+                raise
+            raise
+        finally:
+            pool.join()
+
+    def discard_results(self, results):
+        """
+        .. py:attribute:: discard_results()
+
+            Remove the files written for the `results` of an aborted parallel
+            run which were never consumed. The workers remove their own files
+            when they fail.
+           :param results: The remaining results of `run_parallel`'s pool
+           :type results: iterator
+           :rtype: None
+        """
+        while True:
+            try:
+                chunk = next(results)
+            except StopIteration:
+                break
+            except Exception:
+                continue
+            for result in chunk:
+                self.committer.pending.extend(result.get('pending', ()))
+        self.committer.rollback()
+
+    def serve(self, socket_path, timeout=None):
+        """
+        .. py:attribute:: serve()
+
+            Answer the document/check requests sent to the `socket_path` unix
+            socket until a shutdown request or a SIGINT/SIGTERM. The templates
+            stay loaded between the requests.
+           :param socket_path: Path of the unix socket
+           :type socket_path: string
+           :param timeout: Seconds to wait for a request before closing the connection
+           :type timeout: float
+           :rtype: None
+        """
+        import socket
+        import threading
+        from simplerst_server import DocumentServer
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(socket_path)
+            except socket.error:
+                # Left over by a server that didn't exit cleanly.
+                os.remove(socket_path)
+            else:
+                raise SystemExit("*** A server is already listening on {} ***".format(socket_path))
+            finally:
+                probe.close()
+        server = DocumentServer(socket_path, self.templates, timeout, self.doc_format)
+
+        def stop(signum, frame):
+            # `shutdown` blocks until `serve_forever` returns, so it can't run in this thread.
+            threading.Thread(target=server.shutdown).start()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        print >> self.messages, 'Serving on " {} "'.format(socket_path)
+        self.messages.flush()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(socket_path)
+
+
+DocumentedSource = namedtuple('DocumentedSource', 'source changed objects')
+
+# Templates of `document_source`, loaded from `default_template_dir` on first use.
+_default_templates = None
+
+
+def document_source(source, file_name='<string>', module=None, templates=None, doc_format='auto'):
+    """
+    .. py:function:: document_source(source, file_name='<string>', module=None, templates=None, doc_format='auto')
+
+       Document python source code held in memory, without any file system
+       access (apart from loading the default templates once per process).
+
+       :param source: The python source code
+       :type source: string
+       :param file_name: The name used in the module documentation
+       :type file_name: string
+       :param module: The already parsed `source`, if available
+       :type module: `ast.Module`
+       :param templates: The RST templates, by default the ones shipped next to this module
+       :type templates: TemplateRegistry
+       :param doc_format: The style of the docstrings (see `DOCSTRING_FORMATS`), `auto` to detect it
+       :type doc_format: string
+       :rtype: DocumentedSource (the new source, whether it differs from the
+        original one and the `ObjectInfo` of the documented objects)
+    """
+    global _default_templates
+    if templates is None:
+        if _default_templates is None:
+            _default_templates = TemplateRegistry(default_template_dir())
+        templates = _default_templates
+    parser = Parser(templates)
+    parser.file_name = file_name
+    parser.file_contents = source
+    parser.doc_format = doc_format
+    if module is None:
+        module = parser.create_parser_obj(source)
+    new_source, objects = parser.rewrite(module)
+    return DocumentedSource(new_source, new_source != source, objects)
+
+
+# One `Manager` per worker process, created by `_init_worker`, and the event
+# set by the parent process when the run gets aborted.
+_worker_manager = None
+_worker_aborted = None
+
+
+def _init_worker(args, aborted):
+    global _worker_manager, _worker_aborted
+    # An interrupt is handled by the parent process, which waits for the files
+    # in flight and removes them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_manager = Manager(args=args)
+    _worker_aborted = aborted
+
+
+def _document_worker(file_names):
+    manager = _worker_manager
+    results = []
+    for file_name in file_names:
+        if _worker_aborted.is_set():
+            break
+        try:
+            message = manager.document_file(file_name)
+        except BaseException as e:
+            # Raised by the parent process, which still gets the pending files
+            # of the chunk.
+            manager.committer.rollback()
+            results.append({'file_name': file_name, 'error': e})
+            break
+        # In batch mode the parent process commits the files of all the workers.
+        pending, manager.committer.pending = manager.committer.pending, []
+        results.append({'file_name': file_name,
+                        'message': message,
+                        'digest': manager.cache.get(file_name) if manager.cache is not None else None,
+                        'stats': manager.stats.files.pop() if manager.stats.enabled else None,
+                        'changed': bool(manager.changed_files and manager.changed_files.pop()),
+                        'current': bool(manager.current_files and manager.current_files.pop()),
+                        'pending': pending})
+    return results
+
+
+def main(argv=None):
+    """
+    .. py:function:: main(argv=None)
+
+       The command line entry point (the ``simplerst`` console script): parse
+       `argv` (by default the arguments of the process) and run a `Manager`.
+
+       :rtype: int (the exit status)
+    """
+    import argparse
     parser = argparse.ArgumentParser(
         description="""Create RST doc for functions and classes from current doc and
         for no documented ones. In addition SimpleRST lets you create new document based
@@ -492,6 +2231,111 @@ if __name__ == "__main__":
     parser.add_argument("-f",
                         "-file",
                         help="Apply the code on given file name")
-    args = parser.parse_args()
+    parser.add_argument("-j",
+                        "-jobs",
+                        type=int,
+                        default=1,
+                        help="Number of worker processes used in directory mode")
+    parser.add_argument("-t",
+                        "-templates",
+                        help="The directory of the RST templates (default is the current directory, "
+                             "or the installed templates if it has none)")
+    parser.add_argument("-c",
+                        "-cache",
+                        help="Path of a cache file; files unchanged since the last run are skipped")
+    parser.add_argument("-s",
+                        "-serve",
+                        "--serve",
+                        dest="s",
+                        metavar="SOCKET",
+                        help="Serve document/check requests on the given unix socket (see simplerst_client.py)")
+    parser.add_argument("-changed_since",
+                        "--changed-since",
+                        dest="changed_since",
+                        metavar="REV",
+                        help="Only process the python files changed since the git revision REV (and the untracked ones)")
+    parser.add_argument("-staged",
+                        "--staged",
+                        dest="staged",
+                        action="store_true",
+                        help="Only process the python files staged in git")
+    parser.add_argument("-exclude",
+                        action="append",
+                        metavar="GLOB",
+                        help="Skip the files and directories matching GLOB (can be given several times)")
+    parser.add_argument("-gitignore",
+                        action="store_true",
+                        help="Skip the files and directories ignored by git while walking the directory")
+    parser.add_argument("-check",
+                        "--check",
+                        dest="check",
+                        action="store_true",
+                        help="Don't write anything, exit with status 1 if a file would change")
+    parser.add_argument("-diff",
+                        "--diff",
+                        dest="diff",
+                        action="store_true",
+                        help="Same as -check, and print the unified diff of every file that would change")
+    parser.add_argument("-stats",
+                        "--stats",
+                        dest="stats",
+                        nargs="?",
+                        const="-",
+                        metavar="JSON_FILE",
+                        help="Print the time spent per phase and the slowest files, or dump them to JSON_FILE")
+    parser.add_argument("-format",
+                        "--format",
+                        dest="format",
+                        default="auto",
+                        choices=["auto"] + DOCSTRING_FORMATS.names(),
+                        help="The style of the docstrings, detected per docstring by default")
+    parser.add_argument("-batch",
+                        "--batch",
+                        dest="batch",
+                        action="store_true",
+                        help="Replace the files of a directory run all at once at the end, or none of them")
+    parser.add_argument("-fsync",
+                        "--fsync",
+                        dest="fsync",
+                        default="none",
+                        choices=FileCommitter.FSYNC_POLICIES,
+                        help="Sync every written file, all of them once per batch, or none")
+    parser.add_argument("-report",
+                        "--report",
+                        dest="report",
+                        choices=RunReport.FORMATS,
+                        help="Stream a JSON record per file (status, error, objects, bytes, time) and a summary")
+    parser.add_argument("-report_file",
+                        "--report-file",
+                        dest="report_file",
+                        metavar="FILE",
+                        help="Write the -report to FILE instead of the standard output")
+    parser.add_argument("-extract_cache",
+                        "--extract-cache",
+                        dest="extract_cache",
+                        metavar="DIRECTORY",
+                        help="Cache the extracted docstrings by content hash, shared with doc_extractor")
+    parser.add_argument("-watch",
+                        "--watch",
+                        dest="watch",
+                        action="store_true",
+                        help="Keep running and document the files again whenever they are modified")
+    parser.add_argument("-interval",
+                        type=float,
+                        default=1,
+                        help="Seconds between two checks of the files in -watch mode")
+    parser.add_argument("-debounce",
+                        type=float,
+                        default=0.3,
+                        help="Seconds a modified file has to be left alone before -watch documents it")
+    parser.add_argument("-timeout",
+                        type=float,
+                        default=30,
+                        help="Seconds a server connection may stay idle before it gets closed")
+    args = parser.parse_args(argv)
     manage = Manager(args=args)
-    manage.run()
+    return manage.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,508 @@
+"""
+Benchmark the SimpleRST pipeline on a synthetic corpus.
+
+Each stage of the pipeline is a generator feeding the next one, so the time of
+a stage includes the time of the stages before it (``parse_doc`` includes
+``extract_info``, ``create_rst`` includes ``parse_doc`` and so on). The results
+are printed as JSON so that runs on different commits can be compared.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import SimpleRST
+
+
+def generate_module(classes=10, methods=10, nested=1, decorators=1, doc_lines=3, arg_lines=2, seed=0,
+                    style='legacy'):
+    """
+    .. py:function:: generate_module(classes=10, methods=10, nested=1, decorators=1, doc_lines=3, arg_lines=2, seed=0, style='legacy')
+
+       Create the source of a module with `classes` classes of `methods`
+       methods each, plus as many top level functions as methods. Every
+       function contains `nested` nested functions and gets `decorators`
+       decorators, and every docstring has `doc_lines` lines of text and
+       `arg_lines` documented arguments, in the given docstring `style`
+       (``legacy``, ``google`` or ``numpy``).
+
+       :rtype: string
+    """
+    rand = random.Random(seed)
+    words = ['data', 'value', 'item', 'node', 'index', 'result', 'buffer', 'token', 'entry', 'count']
+
+    def docstring(indent, args):
+        lines = [indent + '"""']
+        for _ in range(doc_lines):
+            lines.append(indent + ' '.join(rand.choice(words) for _ in range(8)))
+        args = args[:arg_lines]
+        if args and style == 'google':
+            lines.extend(['', indent + 'Args:'])
+        elif args and style == 'numpy':
+            lines.extend(['', indent + 'Parameters', indent + '----------'])
+        for arg in args:
+            types, word = rand.choice(['int', 'str', 'list']), rand.choice(words)
+            if style == 'google':
+                lines.append('{}    {} ({}): the {} {}'.format(indent, arg, types, word, arg))
+            elif style == 'numpy':
+                lines.extend(['{}{} : {}'.format(indent, arg, types), '{}    the {} {}'.format(indent, word, arg)])
+            else:
+                lines.append('{}{}({}): the {} {}'.format(indent, arg, types, word, arg))
+        lines.append(indent + '"""')
+        return lines
+
+    def function(name, indent, method):
+        args = ['arg_{}'.format(i) for i in range(max(arg_lines, 1))]
+        lines = [indent + '@decorator_{}'.format(i) for i in range(decorators)]
+        lines.append('{}def {}({}):'.format(indent, name, ', '.join((['self'] if method else []) + args)))
+        lines.extend(docstring(indent + '    ', args))
+        for i in range(nested):
+            lines.append('{}    def nested_{}(value):'.format(indent, i))
+            lines.extend(docstring(indent + '        ', ['value']))
+            lines.append('{}        return value'.format(indent))
+        lines.append('{}    return {}'.format(indent, args[0]))
+        lines.append('')
+        return lines
+
+    lines = ['"""', 'A synthetic module.', '"""', 'import os', '', '']
+    for i in range(decorators):
+        lines.append('decorator_{} = lambda f: f'.format(i))
+    lines.append('')
+    for c in range(classes):
+        lines.append('class Class{}(object):'.format(c))
+        lines.extend(docstring('    ', []))
+        for m in range(methods):
+            lines.extend(function('method_{}'.format(m), '    ', True))
+        lines.append('')
+    for m in range(methods):
+        lines.extend(function('function_{}'.format(m), '', False))
+    return '\n'.join(lines) + '\n'
+
+
+def peak_memory():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def memory_increase(function):
+    """
+    .. py:function:: memory_increase(function)
+
+       Run `function` once in a forked child and return how much the peak
+       memory of the child grew, in kilobytes. The child starts with the
+       memory of the parent, so this is the memory needed by `function`
+       alone, which the process-wide peak of the parent can't tell.
+
+       :rtype: int
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 1
+        try:
+            before = peak_memory()
+            function()
+            os.write(write_fd, str(peak_memory() - before).encode('ascii'))
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    os.waitpid(pid, 0)
+    return int(output) if output else None
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_stages(sources, templates, repeat):
+    """
+    .. py:function:: bench_stages(sources, templates, repeat)
+
+       Time every stage of the pipeline on the in-memory sources and return
+       the best time of `repeat` runs for each one, along with the memory it
+       needs on top of the stages before it (see `memory_increase`).
+
+       :rtype: dict
+    """
+    parser = SimpleRST.Parser(templates)
+    parser.file_name = 'module.py'
+    modules = []
+
+    def parse():
+        del modules[:]
+        modules.extend(parser.create_parser_obj(source) for source in sources)
+
+    def consume(stage):
+        def run():
+            for module in modules:
+                for _ in stage(module):
+                    pass
+        return run
+
+    def rewrite():
+        for source, module in zip(sources, modules):
+            parser.file_contents = source
+            parser.rewrite(module)
+
+    stages = [('ast_parse', parse),
+              ('extract_info', consume(parser.extract_info)),
+              ('parse_doc', consume(parser.parse_doc)),
+              ('create_rst', consume(parser.create_rst)),
+              ('rewrite', rewrite)]
+    results = {}
+    for name, function in stages:
+        # Measured first: the parse stage then starts without any module.
+        memory = memory_increase(function)
+        results[name] = {'seconds': timed(function, repeat), 'memory_kb': memory}
+    return results
+
+
+def records_size(value):
+    """
+    .. py:function:: records_size(value)
+
+       The size in bytes of the records, argument records and containers
+       reachable from `value`; the strings are left out as they are shared
+       with the AST and the source.
+
+       :rtype: int
+    """
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(records_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(records_size(item) for item in value.values())
+    if hasattr(value, '__slots__'):
+        return sys.getsizeof(value) + sum(records_size(getattr(value, name, None))
+                                          for name in value.__slots__)
+    return 0
+
+
+def as_dict(record):
+    """
+    .. py:function:: as_dict(record)
+
+       The dict equivalent of a slotted record, as the pipeline used to carry
+       them: one dict per object, with a dict per argument.
+
+       :rtype: dict
+    """
+    result = dict((name, getattr(record, name, None)) for name in record.__slots__)
+    if 'arguments' in result:
+        result['arguments'] = [as_dict(argument) for argument in result['arguments']]
+    return result
+
+
+def bench_records(source, templates, repeat):
+    """
+    .. py:function:: bench_records(source, templates, repeat)
+
+       Time `parse_doc` on one (large) module and measure the memory held by
+       the records it produces, and by their dict equivalents (`as_dict`).
+
+       :rtype: dict
+    """
+    parser = SimpleRST.Parser(templates)
+    parser.file_name = 'module.py'
+    module = parser.create_parser_obj(source)
+    seconds = timed(lambda: list(parser.parse_doc(module)), repeat)
+    records = [record for doc_lines, record in parser.parse_doc(module)]
+    dicts = [as_dict(record) for record in records]
+    return {'objects': len(records),
+            'seconds': seconds,
+            'records_bytes': records_size(records),
+            'bytes_per_object': records_size(records) // max(len(records), 1),
+            'dict_records_bytes': records_size(dicts),
+            'dict_bytes_per_object': records_size(dicts) // max(len(dicts), 1)}
+
+
+def bench_formats(templates, repeat, **corpus):
+    """
+    .. py:function:: bench_formats(templates, repeat, **corpus)
+
+       Time `parse_doc` on a module written in every docstring style, with
+       the style given and with the style detected per docstring.
+
+       :rtype: dict
+    """
+    results = {}
+    for style in SimpleRST.DOCSTRING_FORMATS.names():
+        parser = SimpleRST.Parser(templates)
+        parser.file_name = 'module.py'
+        module = parser.create_parser_obj(generate_module(style=style, **corpus))
+        objects = sum(1 for _ in parser.parse_doc(module))
+        result = {'objects': objects}
+        for doc_format in (style, 'auto'):
+            parser.doc_format = doc_format
+            seconds = timed(lambda: list(parser.parse_doc(module)), repeat)
+            result['detected' if doc_format == 'auto' else 'given'] = {
+                'seconds': seconds, 'objects_per_second': objects / seconds}
+        results[style] = result
+    return results
+
+
+def bench_run(sources, template_dir, jobs, repeat):
+    """
+    .. py:function:: bench_run(sources, template_dir, jobs, repeat)
+
+       Time `Manager.run` on a directory holding the sources, rewritten from
+       scratch before every run, and a second run on the documented files.
+
+       :rtype: tuple of floats
+    """
+    best = best_rerun = None
+    for _ in range(repeat):
+        directory = tempfile.mkdtemp(prefix='simplerst-bench-')
+        try:
+            for i, source in enumerate(sources):
+                with open(os.path.join(directory, 'module_{}.py'.format(i)), 'w') as f:
+                    f.write(source)
+            args = argparse.Namespace(d=directory, f=None, j=jobs, t=template_dir, c=None, s=None)
+            stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+            try:
+                start = time.time()
+                SimpleRST.Manager(args=args).run()
+                elapsed = time.time() - start
+                start = time.time()
+                SimpleRST.Manager(args=args).run()
+                rerun = time.time() - start
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+        finally:
+            shutil.rmtree(directory)
+        best = elapsed if best is None else min(best, elapsed)
+        best_rerun = rerun if best_rerun is None else min(best_rerun, rerun)
+    return best, best_rerun
+
+
+# Run by `bench_startup` in a child interpreter: time every import done by
+# `{statement}`, like `python -X importtime` (which Python 2 doesn't have), and
+# write the timings as JSON on the standard error.
+IMPORT_TIMER = """
+import sys
+from timeit import default_timer
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+_import = builtins.__import__
+times = []
+nested = [0.0]
+
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return _import(name, *args, **kwargs)
+    nested.append(0.0)
+    start = default_timer()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        elapsed = default_timer() - start
+        inner = nested.pop()
+        nested[-1] += elapsed
+        times.append((name, elapsed - inner, elapsed))
+
+builtins.__import__ = timed_import
+try:
+    {statement}
+except SystemExit:
+    pass
+builtins.__import__ = _import
+import json
+sys.stderr.write(json.dumps(times) + '\\n')
+"""
+
+
+def command_seconds(command, repeat, env):
+    best = None
+    for _ in range(repeat):
+        with open(os.devnull, 'w') as devnull:
+            start = time.time()
+            subprocess.call(command, stdout=devnull, stderr=devnull, env=env)
+            elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def import_times(statement, env, limit=10):
+    """
+    .. py:function:: import_times(statement, env, limit=10)
+
+       Run `statement` in a child interpreter and return the `limit` imports
+       that took the longest, excluding the imports they triggered, with
+       their self and cumulative time in milliseconds.
+
+       :rtype: list of dicts
+    """
+    process = subprocess.Popen([sys.executable, '-c', IMPORT_TIMER.format(statement=statement)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    output, error = process.communicate()
+    times = json.loads(error.decode('utf-8').strip().split('\n')[-1])
+    times.sort(key=lambda item: item[1], reverse=True)
+    return [{'module': name, 'self_ms': 1000 * own, 'cumulative_ms': 1000 * cumulative}
+            for name, own, cumulative in times[:limit]]
+
+
+# The start-up budget of a -f run of SimpleRST, in milliseconds above the bare
+# interpreter start-up, checked by the test suite.
+STARTUP_BUDGET_MS = 60
+
+
+def bench_startup(repeat):
+    """
+    .. py:function:: bench_startup(repeat)
+
+       Time the start-up of the command line tools in child interpreters: the
+       bare interpreter, the import of SimpleRST and doc_extractor, and a
+       `-f` run of SimpleRST on a small module (with ``-check``, so that it
+       renders the documentation without writing it), started the way the
+       ``simplerst`` console script does. Every time is also given above the
+       bare interpreter, along with the slowest imports of the `-f` run.
+
+       :rtype: dict
+    """
+    directory = tempfile.mkdtemp(prefix='simplerst-startup-')
+    try:
+        file_name = os.path.join(directory, 'module.py')
+        with open(file_name, 'w') as f:
+            f.write(generate_module(classes=2, methods=3))
+        env = dict(os.environ)
+        # Time the start-up from the compiled modules, like an installed tool's:
+        # the first run writes them, the best run is reported.
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.path.dirname(os.path.abspath(SimpleRST.__file__))] +
+            [path for path in [env.get('PYTHONPATH')] if path])
+        run_file = 'from SimpleRST import main; main([{!r}, {!r}, {!r}])'.format('-f', file_name, '-check')
+        commands = [('interpreter', 'pass'),
+                    ('import_simplerst', 'import SimpleRST'),
+                    ('import_doc_extractor', 'import doc_extractor'),
+                    ('simplerst_file', run_file)]
+        results = {}
+        for name, statement in commands:
+            seconds = command_seconds([sys.executable, '-c', statement], repeat, env)
+            results[name] = {'ms': 1000 * seconds}
+        for result in results.values():
+            result['over_interpreter_ms'] = result['ms'] - results['interpreter']['ms']
+        results['imports'] = import_times(run_file, env)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Benchmark the SimpleRST pipeline on synthetic modules and print
+        the results as JSON.
+        """)
+    parser.add_argument("-files", type=int, default=20, help="Number of modules")
+    parser.add_argument("-classes", type=int, default=10, help="Classes per module")
+    parser.add_argument("-methods", type=int, default=10, help="Methods per class (and functions per module)")
+    parser.add_argument("-nested", type=int, default=1, help="Nested functions per function")
+    parser.add_argument("-decorators", type=int, default=1, help="Decorators per function")
+    parser.add_argument("-doc_lines", type=int, default=3, help="Text lines per docstring")
+    parser.add_argument("-arg_lines", type=int, default=2, help="`name(type): desc` lines per docstring")
+    parser.add_argument("-repeat", type=int, default=3, help="Runs per measure, the best one is reported")
+    parser.add_argument("-large_classes", type=int, default=200,
+                        help="Classes of the large module of the records memory benchmark")
+    parser.add_argument("-j", "-jobs", type=int, default=1, help="Worker processes for the Manager.run benchmark")
+    parser.add_argument("-o", "-output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("-startup", action="store_true", help="Only run the start-up benchmark")
+    parser.add_argument("-budget", type=float, metavar="MS",
+                        help="Exit with status 1 if a -f run of SimpleRST takes more than MS milliseconds "
+                             "above the bare interpreter start-up")
+    args = parser.parse_args()
+    # A start-up lasts a few tens of milliseconds, so it gets more runs.
+    startup_repeat = max(args.repeat, 10)
+
+    if args.startup:
+        results = {'revision': git_revision(),
+                   'python': sys.version.split()[0],
+                   'startup': bench_startup(startup_repeat)}
+        return report(results, args)
+
+    template_dir = os.path.dirname(os.path.abspath(SimpleRST.__file__))
+    sources = [generate_module(args.classes, args.methods, args.nested, args.decorators,
+                               args.doc_lines, args.arg_lines, seed)
+               for seed in range(args.files)]
+    n_bytes = sum(len(source) for source in sources)
+    n_lines = sum(source.count('\n') for source in sources)
+
+    stages = bench_stages(sources, SimpleRST.TemplateRegistry(template_dir), args.repeat)
+    run_seconds, rerun_seconds = bench_run(sources, template_dir, args.j, args.repeat)
+    large_module = generate_module(args.large_classes, args.methods, args.nested, args.decorators,
+                                   args.doc_lines, args.arg_lines)
+    records = bench_records(large_module, SimpleRST.TemplateRegistry(template_dir), args.repeat)
+    formats = bench_formats(SimpleRST.TemplateRegistry(template_dir), args.repeat,
+                            classes=args.classes, methods=args.methods, nested=args.nested,
+                            decorators=args.decorators, doc_lines=args.doc_lines, arg_lines=args.arg_lines)
+    for result in stages.values():
+        result['files_per_second'] = args.files / result['seconds']
+        result['lines_per_second'] = n_lines / result['seconds']
+    results = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'corpus': {'files': args.files,
+                   'classes': args.classes,
+                   'methods': args.methods,
+                   'nested': args.nested,
+                   'decorators': args.decorators,
+                   'doc_lines': args.doc_lines,
+                   'arg_lines': args.arg_lines,
+                   'bytes': n_bytes,
+                   'lines': n_lines},
+        'repeat': args.repeat,
+        'stages': stages,
+        'run': {'seconds': run_seconds,
+                'jobs': args.j,
+                'files_per_second': args.files / run_seconds,
+                'lines_per_second': n_lines / run_seconds,
+                'rerun_seconds': rerun_seconds},
+        'records': records,
+        'formats': formats,
+        'startup': bench_startup(startup_repeat),
+        'peak_memory_kb': peak_memory()}
+    return report(results, args)
+
+
+def report(results, args):
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.o:
+        with open(args.o, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    overhead = results['startup']['simplerst_file']['over_interpreter_ms']
+    if args.budget is not None and overhead > args.budget:
+        sys.stderr.write('*** The start-up of SimpleRST -f takes {:.1f} ms, over the budget of {:.1f} ms ***\n'
+                         .format(overhead, args.budget))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,419 @@
-
-import argparse
 import ast
-import glob
-from os import path as ospath, mkdir, walk
-from itertools import chain
+from collections import deque
+from os import path as ospath, makedirs, remove, rename, rmdir, stat, walk
+
+from simplerst_extraction import ExtractionCache, get_docstring, load_extraction
+
+
+def read_extraction(file_name, cache_dir=None):
+    """
+    Return the (source, extraction) of a file, loaded from the extraction
+    cache in `cache_dir` when the file has already been parsed, by this tool
+    or by SimpleRST.
+    """
+    with open(file_name, 'rb') as f:
+        source = f.read()
+    cache = ExtractionCache(cache_dir) if cache_dir else None
+    return source, load_extraction(source, cache)[0]
+
+
+def extract_docs(file_name, cache_dir=None):
+    """
+    Parse one file and return its (file_name, docstrings, error). This runs in
+    the worker processes, so it has to be a module level function.
+    """
+    try:
+        source, extraction = read_extraction(file_name, cache_dir)
+    except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+        return file_name, [], e
+    return file_name, [doc for doc in Parser.class_docs(extraction.records)
+                       if doc and not doc.strip().startswith("@")], None
+
+
+def extract_page_docs(file_name, cache_dir=None):
+    """
+    Same as `extract_docs`, with the module docstring first: the docstrings of
+    a `SphinxTree` page.
+    """
+    try:
+        source, extraction = read_extraction(file_name, cache_dir)
+    except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+        return file_name, [], e
+    docs = [extraction.module_doc] + list(Parser.class_docs(extraction.records))
+    return file_name, [doc for doc in docs if doc and not doc.strip().startswith("@")], None
+
+
+def extract_symbols(file_name, cache_dir=None):
+    """
+    Parse one file and return its (file_name, (hash, symbols), error), the
+    symbols being the (kind, name, qualname, lineno, args, docstring) of the
+    module, its classes and their methods.
+    """
+    try:
+        source, extraction = read_extraction(file_name, cache_dir)
+    except (SyntaxError, ValueError) as e:
+        return file_name, None, e
+    import hashlib
+    symbols = [('module', ospath.splitext(ospath.basename(file_name))[0], '', 1, [], extraction.module_doc)]
+    classes = {}
+    for index, (kind, name, lineno, docstring, args, parent) in enumerate(extraction.records):
+        if kind == 'class' and parent == -1:
+            classes[index] = name
+            symbols.append(('class', name, name, lineno, [], docstring))
+        elif kind == 'attribute' and parent in classes:
+            symbols.append(('method', name, classes[parent] + '.' + name, lineno, args, docstring))
+    return file_name, (hashlib.sha1(source).hexdigest(), symbols), None
+
+
+class DocIndex(object):
+    """
+    A persistent SQLite index of the modules, classes and methods of the
+    extracted files, with their docstring, line number and arguments. Every
+    file row keeps the mtime, size and hash of the file it was built from, so
+    that only the modified files get parsed again.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        package TEXT NOT NULL,
+        mtime REAL NOT NULL,
+        size INTEGER NOT NULL,
+        hash TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS symbols (
+        file_id INTEGER NOT NULL REFERENCES files(id),
+        position INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        qualname TEXT NOT NULL,
+        lineno INTEGER NOT NULL,
+        args TEXT NOT NULL,
+        docstring TEXT,
+        PRIMARY KEY (file_id, position));
+    CREATE INDEX IF NOT EXISTS symbols_name ON symbols(name);
+    CREATE INDEX IF NOT EXISTS symbols_qualname ON symbols(qualname);
+    """
+
+    def __init__(self, db_path):
+        # Only imported by the runs that use an index.
+        import sqlite3
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(self.SCHEMA)
+        self.removed = []
+
+    def close(self):
+        self.db.close()
+
+    def stale(self, files):
+        """
+        Yield the (package, file_name) of `files` whose mtime or size differs
+        from the indexed ones. The indexed files that are not in `files` get
+        removed by the next `update`.
+        """
+        known = dict((path, (mtime, size)) for path, mtime, size in
+                     self.db.execute("SELECT path, mtime, size FROM files"))
+        for package, file_name in files:
+            info = stat(file_name)
+            if known.pop(file_name, None) != (info.st_mtime, info.st_size):
+                yield package, file_name
+        self.removed = list(known)
+
+    def update(self, results):
+        """
+        Store the (package, file_name, (hash, symbols), error) results, and
+        drop the files that `stale` found removed, in a single transaction.
+        """
+        import json
+        updated = 0
+        with self.db:
+            for package, file_name, extracted, error in results:
+                if error is not None:
+                    print("*** File {} gets escaped. ***\n*** {} ***".format(file_name, error))
+                    continue
+                digest, symbols = extracted
+                info = stat(file_name)
+                row = self.db.execute("SELECT id, hash FROM files WHERE path = ?", (file_name,)).fetchone()
+                if row is None:
+                    file_id = self.db.execute(
+                        "INSERT INTO files (path, package, mtime, size, hash) VALUES (?, ?, ?, ?, ?)",
+                        (file_name, package, info.st_mtime, info.st_size, digest)).lastrowid
+                else:
+                    file_id = row[0]
+                    self.db.execute("UPDATE files SET package = ?, mtime = ?, size = ?, hash = ? WHERE id = ?",
+                                    (package, info.st_mtime, info.st_size, digest, file_id))
+                    if row[1] == digest:
+                        # Touched but not modified.
+                        continue
+                    self.db.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+                self.db.executemany(
+                    "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(file_id, position, kind, name, qualname, lineno, json.dumps(args), docstring)
+                     for position, (kind, name, qualname, lineno, args, docstring) in enumerate(symbols)])
+                updated += 1
+            for file_name in self.removed:
+                self.db.execute("DELETE FROM symbols WHERE file_id = (SELECT id FROM files WHERE path = ?)",
+                                (file_name,))
+                self.db.execute("DELETE FROM files WHERE path = ?", (file_name,))
+        self.removed = []
+        return updated
+
+    def find(self, pattern):
+        """
+        Yield the (path, lineno, kind, qualname, docstring) of the symbols
+        whose name or qualified name matches the `pattern` glob.
+        """
+        return self.db.execute(
+            "SELECT files.path, lineno, kind, qualname, docstring FROM symbols "
+            "JOIN files ON files.id = symbols.file_id "
+            "WHERE name GLOB ? OR qualname GLOB ? ORDER BY files.path, position",
+            (pattern, pattern))
+
+    def search(self, text):
+        """
+        Same as `find` for the symbols whose docstring contains `text`.
+        """
+        return self.db.execute(
+            "SELECT files.path, lineno, kind, qualname, docstring FROM symbols "
+            "JOIN files ON files.id = symbols.file_id "
+            "WHERE docstring LIKE ? ORDER BY files.path, position",
+            ('%' + text + '%',))
+
+    def docs(self):
+        """
+        Yield the (package, docstring) that `Parser.rst_creator` writes, in the
+        same order.
+        """
+        return self.db.execute(
+            "SELECT package, docstring FROM symbols JOIN files ON files.id = symbols.file_id "
+            "WHERE kind != 'module' AND docstring IS NOT NULL AND docstring != '' "
+            "AND ltrim(docstring) NOT LIKE '@%' "
+            "ORDER BY package, files.path, position")
+
+
+class SphinxTree(object):
+    """
+    A Sphinx source tree mirroring the packages (directories) of the project:
+    one page per module, `<package directories>/<module>.rst`, and one
+    `index.rst` per package with the docstrings of its `__init__.py` and a
+    toctree of its modules and subpackages. A manifest keeps the mtime and
+    size of the module of every page: only the modified modules are parsed
+    again, and a page is written only when its text changes, so that the
+    other pages keep their mtime and incremental Sphinx builds skip them.
+    """
+    MANIFEST = '.doc_extractor.json'
+    # Written when the output directory has no conf.py, so that it builds as is.
+    CONF = "project = {!r}\nmaster_doc = 'index'\n"
+    # Bump when the pages change, the trees written by older versions are rewritten.
+    VERSION = 1
+
+    def __init__(self, output_path, input_path, root=None):
+        self.output_path = output_path
+        if input_path.endswith(".py"):
+            self.base = ospath.dirname(input_path) or '.'
+        else:
+            self.base = input_path
+        self.root = root or ospath.basename(ospath.abspath(self.base))
+        self.manifest_path = ospath.join(output_path, self.MANIFEST)
+        # file_name -> [mtime, size] of the modules that have a page, and
+        # package key -> toctree entries of the written indexes.
+        self.sources = {}
+        self.toctrees = {}
+        import json
+        try:
+            with open(self.manifest_path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = {}
+        if (data.get('version'), data.get('root'), data.get('base')) == (
+                self.VERSION, self.root, ospath.abspath(self.base)):
+            self.sources = data['sources']
+            self.toctrees = data['toctrees']
+        # file_name -> (package directories, module name, [mtime, size]) of the walked modules.
+        self.files = {}
+        # package key -> docstrings of the `__init__.py` parsed in this run.
+        self.inits = {}
+        self.parsed = self.written = self.removed = 0
+
+    @staticmethod
+    def key(dirs):
+        return '/'.join(dirs)
+
+    def page_path(self, dirs, module):
+        if module == '__init__':
+            name = 'index'
+        elif module == 'index':
+            # Taken by the package page.
+            name = 'index_'
+        else:
+            name = module
+        return ospath.join(self.output_path, *(list(dirs) + [name + '.rst']))
+
+    def dotted_name(self, dirs, module='__init__'):
+        return '.'.join([self.root] + list(dirs) + ([module] if module != '__init__' else []))
+
+    @staticmethod
+    def page(name, docs, entries=()):
+        lines = [name, '=' * len(name), '', '.. py:module:: ' + name, '']
+        for doc in docs:
+            lines.extend([doc, ''])
+        if entries:
+            lines.extend(['.. toctree::', '   :maxdepth: 2', ''])
+            lines.extend('   ' + entry for entry in entries)
+            lines.append('')
+        return '\n'.join(lines)
+
+    def write(self, path, text):
+        """
+        Write `text` to `path` unless the file already holds it.
+        """
+        try:
+            with open(path) as f:
+                if f.read() == text:
+                    return False
+        except (IOError, OSError, ValueError):
+            directory = ospath.dirname(path)
+            if not ospath.isdir(directory):
+                makedirs(directory)
+        with open(path, 'w') as f:
+            f.write(text)
+        self.written += 1
+        return True
+
+    def remove(self, path):
+        try:
+            remove(path)
+        except OSError:
+            return
+        self.removed += 1
+        # Drop the directories left empty, up to the output directory.
+        directory = ospath.dirname(path)
+        while ospath.abspath(directory) != ospath.abspath(self.output_path):
+            try:
+                rmdir(directory)
+            except OSError:
+                break
+            directory = ospath.dirname(directory)
+
+    def parts(self, file_name):
+        """
+        Return the (package directories, module name) of a module.
+        """
+        relative = ospath.splitext(ospath.relpath(file_name, self.base))[0].split(ospath.sep)
+        return tuple(relative[:-1]), relative[-1]
+
+    def stale(self, files):
+        """
+        Yield the (package, file_name) of `files` which are modified since
+        their page was written, or have no page.
+        """
+        for package, file_name in files:
+            dirs, module = self.parts(file_name)
+            info = stat(file_name)
+            self.files[file_name] = (dirs, module, [info.st_mtime, info.st_size])
+            if self.sources.get(file_name) != [info.st_mtime, info.st_size] or not ospath.exists(
+                    self.page_path(dirs, module)):
+                yield package, file_name
+
+    def update(self, results):
+        """
+        Write the pages of the (package, file_name, docstrings, error) results,
+        the package pages being left to `finish`.
+        """
+        for package, file_name, docs, error in results:
+            self.parsed += 1
+            dirs, module, info = self.files[file_name]
+            if error is not None:
+                print("*** File {} gets escaped. ***\n*** {} ***".format(file_name, error))
+                self.sources.pop(file_name, None)
+                if module == '__init__':
+                    self.inits[self.key(dirs)] = []
+                else:
+                    self.remove(self.page_path(dirs, module))
+                continue
+            self.sources[file_name] = info
+            if module == '__init__':
+                self.inits[self.key(dirs)] = docs
+            else:
+                self.write(self.page_path(dirs, module), self.page(self.dotted_name(dirs, module), docs))
+
+    def packages(self):
+        """
+        Return the {package directories: (toctree entries, __init__ file_name)}
+        of the walked modules which have a page.
+        """
+        modules, subpackages, inits = {}, {}, {}
+        for file_name, (dirs, module, info) in self.files.items():
+            if file_name not in self.sources:
+                continue
+            if module == '__init__':
+                inits[dirs] = file_name
+            else:
+                modules.setdefault(dirs, []).append(module)
+            modules.setdefault(dirs, [])
+            for depth in range(len(dirs)):
+                subpackages.setdefault(dirs[:depth], set()).add(dirs[depth])
+                modules.setdefault(dirs[:depth], [])
+        packages = {}
+        for dirs, names in modules.items():
+            entries = [ospath.splitext(ospath.basename(self.page_path(dirs, name)))[0] for name in sorted(names)]
+            entries.extend(name + '/index' for name in sorted(subpackages.get(dirs, ())))
+            packages[dirs] = (entries, inits.get(dirs))
+        return packages
+
+    def missing_inits(self):
+        """
+        Yield the (package, file_name) of the unmodified `__init__.py` whose
+        package page has to be written again, its toctree having changed.
+        """
+        for dirs, (entries, init) in self.packages().items():
+            key = self.key(dirs)
+            if init is not None and key not in self.inits and (
+                    self.toctrees.get(key) != entries or not ospath.exists(self.page_path(dirs, '__init__'))):
+                yield None, init
+
+    def finish(self):
+        """
+        Write the package pages whose `__init__.py` or toctree changed, remove
+        the pages of the modules and packages which are gone, write a minimal
+        conf.py if there is none and save the manifest.
+        """
+        for file_name in list(self.sources):
+            if file_name not in self.files:
+                del self.sources[file_name]
+                dirs, module = self.parts(file_name)
+                if module == '__init__':
+                    # The package page stays if the package still has modules.
+                    self.inits[self.key(dirs)] = []
+                else:
+                    self.remove(self.page_path(dirs, module))
+        toctrees = {}
+        for dirs, (entries, init) in self.packages().items():
+            key = self.key(dirs)
+            toctrees[key] = entries
+            if key in self.inits or self.toctrees.get(key) != entries or not ospath.exists(
+                    self.page_path(dirs, '__init__')):
+                self.write(self.page_path(dirs, '__init__'),
+                           self.page(self.dotted_name(dirs), self.inits.get(key, []), entries))
+        for key in self.toctrees:
+            if key not in toctrees:
+                self.remove(self.page_path(key.split('/') if key else [], '__init__'))
+        self.toctrees = toctrees
+        conf_path = ospath.join(self.output_path, 'conf.py')
+        if not ospath.exists(conf_path):
+            with open(conf_path, 'w') as f:
+                f.write(self.CONF.format(self.root))
+        self.save()
+
+    def save(self):
+        import json
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': self.VERSION,
+                       'root': self.root,
+                       'base': ospath.abspath(self.base),
+                       'sources': self.sources,
+                       'toctrees': self.toctrees}, f)
+        rename(temp_path, self.manifest_path)
 
 
 class Parser(object):
@@ -12,40 +422,168 @@ class Parser(object):
         self.input_path = kwargs['input_path']
         self.output_path = kwargs['output_path']
         self.projct_name = kwargs['projct_name']
+        self.jobs = kwargs.get('jobs') or 1
+        self.index = kwargs.get('index')
+        # The extraction cache shared with SimpleRST.
+        self.cache_dir = kwargs.get('cache_dir')
+        # Write a Sphinx source tree (see `SphinxTree`) instead of one file per package.
+        self.sphinx = kwargs.get('sphinx', False)
+        # Number of files being parsed ahead of the writer, which bounds the memory.
+        self.window = kwargs.get('window') or self.jobs * 4
         if not ospath.isdir(self.output_path):
-            mkdir(self.output_path)
+            makedirs(self.output_path)
 
-    def get_doc(self, module):
+    @staticmethod
+    def get_doc(module):
         for node in module.body:
             if isinstance(node, ast.ClassDef):
-                yield ast.get_docstring(node)
+                yield get_docstring(node)
                 for sub_node in node.body:
                     if isinstance(sub_node, ast.FunctionDef):
-                        yield ast.get_docstring(sub_node)
+                        yield get_docstring(sub_node)
+
+    @staticmethod
+    def class_docs(records):
+        """
+        Same as `get_doc`, from the records of an `simplerst_extraction.Extraction`.
+        """
+        classes = set()
+        for index, (kind, name, lineno, docstring, args, parent) in enumerate(records):
+            if kind == 'class' and parent == -1:
+                classes.add(index)
+                yield docstring
+            elif kind == 'attribute' and parent in classes:
+                yield docstring
 
     def rst_creator(self):
-        if self.input_path.endswith(".py"):
-            with open(input_path) as f:
-                self.generate_rst(f, input_path, True)
+        """
+        Write the docstrings of every package (directory) of `input_path` to
+        `output_path/<package>.rst`, in walk order. The files are parsed in a
+        pool of `jobs` processes and the docstrings are streamed to the output
+        files as soon as they are extracted, in a deterministic order. With
+        `sphinx`, write a Sphinx source tree instead (see `write_tree`).
+        """
+        if self.sphinx:
+            self.write_tree()
+        elif self.index is not None:
+            self.update_index()
+            self.write_docs(self.index.docs())
         else:
-            for dirpath, dirnames, filenames in walk(input_path):
-                for dirname in dirnames:
-                    doc = chain.form_iterable(self.generate_rst(ospath.join(input_path, dirname)))
-                    with open(dirname, 'w') as f:
-                        f.write("\n".join(doc))
-
-    def generate_rst(self, path):
-        for name in glob.glob(path + "/**/*.py",
-                              recursive=True):
-            with open(name) as f:
-                yield self.create_rst(f, name)
-
-    def create_rst(self, inp, name, one_file=False):
-        for doc in self.get_doc(ast.parse(inp.read())):
+            self.write_docs(self.iter_docs())
+
+    def iter_docs(self):
+        for package, file_name, docs, error in self.extract(self.iter_files()):
+            if error is not None:
+                print("*** File {} gets escaped. ***\n*** {} ***".format(file_name, error))
+                continue
+            for doc in docs:
+                yield package, doc
+
+    def write_tree(self):
+        """
+        Write the Sphinx source tree of `input_path` to `output_path`, parsing
+        only the modules modified since the previous run.
+        """
+        tree = SphinxTree(self.output_path, self.input_path, self.projct_name)
+        tree.update(self.extract(tree.stale(self.iter_files()), extract_page_docs))
+        tree.update(self.extract(tree.missing_inits(), extract_page_docs))
+        tree.finish()
+        print("*** {} of {} modules parsed, {} page(s) written, {} removed ***".format(
+            tree.parsed, len(tree.files), tree.written, tree.removed))
+        return tree
+
+    def update_index(self):
+        """
+        Parse the files modified since the last run and store their symbols in
+        the index.
+        """
+        stale = self.index.stale(self.iter_files())
+        return self.index.update(self.extract(stale, extract_symbols))
+
+    def write_docs(self, docs):
+        """
+        Write the (package, docstring) pairs to the package files, the pairs
+        of a package have to be contiguous.
+        """
+        output = None
+        current = None
+        try:
+            for package, doc in docs:
+                if package != current:
+                    if output is not None:
+                        output.close()
+                    output = open(ospath.join(self.output_path, package + '.rst'), 'w')
+                    current = package
+                else:
+                    output.write("\n")
+                output.write(doc)
+        finally:
+            if output is not None:
+                output.close()
+
+    def package_name(self, dirpath):
+        root = self.projct_name or ospath.basename(ospath.normpath(self.input_path))
+        relative = ospath.relpath(dirpath, self.input_path)
+        if relative == '.':
+            return root
+        return '.'.join([root] + relative.split(ospath.sep))
+
+    def iter_files(self):
+        """
+        Walk `input_path` once and yield the (package, file_name) of every
+        python file, sorted within each directory.
+        """
+        if self.input_path.endswith(".py"):
+            name = ospath.splitext(ospath.basename(self.input_path))[0]
+            yield self.projct_name or name, self.input_path
+            return
+        for dirpath, dirnames, filenames in walk(self.input_path):
+            dirnames.sort()
+            package = self.package_name(dirpath)
+            for name in sorted(filenames):
+                if name.endswith(".py"):
+                    yield package, ospath.join(dirpath, name)
+
+    def extract(self, files, function=extract_docs):
+        """
+        Yield the (package,) + function(file_name, cache_dir) of every (package, file_name)
+        in the order they are given, keeping at most `window` files in flight.
+        """
+        if self.jobs <= 1:
+            for package, file_name in files:
+                yield (package,) + function(file_name, self.cache_dir)
+            return
+        from multiprocessing import Pool
+        pool = Pool(self.jobs)
+        pending = deque()
+        try:
+            for package, file_name in files:
+                pending.append((package, pool.apply_async(function, (file_name, self.cache_dir))))
+                if len(pending) >= self.window:
+                    package, result = pending.popleft()
+                    yield (package,) + result.get()
+            while pending:
+                package, result = pending.popleft()
+                yield (package,) + result.get()
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    @staticmethod
+    def create_rst(inp, name, one_file=False):
+        for doc in Parser.get_doc(ast.parse(inp.read())):
             if doc and not doc.strip().startswith("@"):
                 yield doc
 
-if __name__ == '__main__':
+
+def main(argv=None):
+    """
+    The command line entry point (the ``doc-extractor`` console script).
+    """
+    import argparse
     parser = argparse.ArgumentParser(
         description="""Extract RST documentations from files.
         """)
@@ -58,10 +596,60 @@ if __name__ == '__main__':
     parser.add_argument("-p",
                         "-projct_name",
                         help="The name of base directory for project.")
-    args = parser.parse_args()
+    parser.add_argument("-j",
+                        "-jobs",
+                        type=int,
+                        default=1,
+                        help="Number of worker processes.")
+    parser.add_argument("-db",
+                        "-index",
+                        help="A SQLite index of the symbols, only the modified files are parsed again.")
+    parser.add_argument("-extract_cache",
+                        "--extract-cache",
+                        dest="extract_cache",
+                        help="Cache the extracted docstrings by content hash, shared with SimpleRST.")
+    parser.add_argument("-sphinx",
+                        "--sphinx",
+                        dest="sphinx",
+                        action="store_true",
+                        help="Write a Sphinx source tree: a page per module and a toctree index per package. "
+                             "Only the pages of the modified modules are written again.")
+    parser.add_argument("-find",
+                        help="Print the indexed symbols whose name matches the given glob.")
+    parser.add_argument("-search",
+                        help="Print the indexed symbols whose docstring contains the given text.")
+    parser.add_argument("-regenerate",
+                        action="store_true",
+                        help="Write the output from the index without reading the sources.")
+    args = parser.parse_args(argv)
+    if args.sphinx and (args.db or args.regenerate):
+        parser.error("-sphinx keeps its own manifest and can't be used with an index (-db)")
 
-    input_path, output_path, projct_name = args.i, args.o, args.p
-    PS = Parser(input_path=input_path,
-                output_path=output_path,
-                projct_name=projct_name)
-    PS.rst_creator()
+    index = DocIndex(args.db) if args.db else None
+    if args.find or args.search:
+        if index is None:
+            parser.error("-find and -search need an index (-db)")
+        rows = index.find(args.find) if args.find else index.search(args.search)
+        for path, lineno, kind, qualname, docstring in rows:
+            summary = (docstring or '').strip().split("\n")[0]
+            print("{}:{}: {} {}  {}".format(path, lineno, kind, qualname, summary))
+    elif args.regenerate:
+        if index is None:
+            parser.error("-regenerate needs an index (-db)")
+        Parser(input_path=args.i or '', output_path=args.o, projct_name=args.p).write_docs(index.docs())
+    else:
+        input_path, output_path, projct_name = args.i, args.o, args.p
+        PS = Parser(input_path=input_path,
+                    output_path=output_path,
+                    projct_name=projct_name,
+                    jobs=args.j,
+                    index=index,
+                    cache_dir=args.extract_cache,
+                    sphinx=args.sphinx)
+        PS.rst_creator()
+    if index is not None:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
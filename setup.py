@@ -0,0 +1,45 @@
+"""
+Install SimpleRST and doc_extractor along with their console scripts:
+
+    pip install .
+
+The default RST templates are installed to <prefix>/share/simplerst, where
+SimpleRST finds them when they aren't in the current directory. SimpleRST and
+its server are Python 2 only, on Python 3 only doc_extractor and the client
+get installed.
+"""
+import sys
+
+from setuptools import setup
+
+TEMPLATES = ['temp_function.rst', 'temp_class.rst', 'attribute.rst', 'module.rst']
+
+MODULES = ['doc_extractor', 'simplerst_extraction', 'simplerst_client']
+SCRIPTS = ['doc-extractor = doc_extractor:main', 'simplerst-client = simplerst_client:main']
+DATA_FILES = []
+if sys.version_info[0] == 2:
+    MODULES += ['SimpleRST', 'simplerst_server']
+    SCRIPTS += ['simplerst = SimpleRST:main']
+    DATA_FILES += [('share/simplerst', TEMPLATES)]
+
+with open('README.rst') as f:
+    long_description = f.read()
+
+setup(
+    name='SimpleRST',
+    version='0.1.0',
+    description='Create RST documentation from the code and the docstrings of python modules',
+    long_description=long_description,
+    url='https://github.com/Kasramvd/SimpleRST',
+    license='GPLv3',
+    py_modules=MODULES,
+    python_requires='>=2.7',
+    data_files=DATA_FILES,
+    entry_points={'console_scripts': SCRIPTS},
+    classifiers=[
+        'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
+        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
+        'Topic :: Documentation',
+    ],
+)
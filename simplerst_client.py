@@ -0,0 +1,96 @@
+"""
+A small client for the ``SimpleRST.py -serve`` server. It only imports what it
+needs to talk to the server, so that it starts faster than SimpleRST itself.
+"""
+import argparse
+import json
+import socket
+import sys
+
+
+def request(socket_path, command, timeout=None, **kwargs):
+    """
+    .. py:function:: request(socket_path, command, timeout=None, **kwargs)
+
+       Send one request to the server and return its response.
+
+       :param socket_path: Path of the server's unix socket
+       :type socket_path: string
+       :param command: One of ``document``, ``check``, ``ping`` and ``shutdown``
+       :type command: string
+       :rtype: dict
+    """
+    kwargs['command'] = command
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall((json.dumps(kwargs) + '\n').encode('utf-8'))
+        response = client.makefile('rb')
+        try:
+            return json.loads(response.readline().decode('utf-8'))
+        finally:
+            response.close()
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Send a file to a running SimpleRST server.
+        """)
+    parser.add_argument("socket",
+                        help="Path of the server's unix socket")
+    parser.add_argument("-f",
+                        "-file",
+                        help="The python file to document")
+    parser.add_argument("-check",
+                        action="store_true",
+                        help="Only check whether the file would change (exit status 1 if so)")
+    parser.add_argument("-diff",
+                        action="store_true",
+                        help="Print a unified diff instead of the documented source")
+    parser.add_argument("-i",
+                        "-inplace",
+                        action="store_true",
+                        help="Write the documented source back to the file")
+    parser.add_argument("-format",
+                        help="The style of the docstrings (legacy, google or numpy), detected by default")
+    parser.add_argument("-shutdown",
+                        action="store_true",
+                        help="Stop the server")
+    parser.add_argument("-timeout",
+                        type=float,
+                        default=30,
+                        help="Seconds to wait for the server")
+    args = parser.parse_args()
+
+    if args.shutdown:
+        response = request(args.socket, 'shutdown', args.timeout)
+    elif not args.f:
+        response = request(args.socket, 'ping', args.timeout)
+    else:
+        with open(args.f, 'rb') as f:
+            source = f.read().decode('utf-8')
+        response = request(args.socket,
+                           'check' if args.check else 'document',
+                           args.timeout,
+                           source=source,
+                           file_name=args.f,
+                           diff=args.diff,
+                           format=args.format)
+    if response['status'] != 'ok':
+        sys.stderr.write('*** {} ***\n'.format(response['error']))
+        return 2
+    if args.diff:
+        sys.stdout.write(response['diff'])
+    elif args.i and response['changed']:
+        with open(args.f, 'wb') as f:
+            f.write(response['source'].encode('utf-8'))
+    elif 'source' in response:
+        sys.stdout.write(response['source'])
+    return 1 if args.check and response['changed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+The extraction layer shared by SimpleRST and doc_extractor: the classes and
+functions of a module, with their docstring, line number and arguments, and
+an on-disk cache of them keyed by the hash of the source, so that a file
+parsed by one tool is not parsed again by the other one.
+
+This module runs on Python 2 and 3. The modules used by the cache only are
+imported on first use.
+"""
+import ast
+import os
+import sys
+from collections import namedtuple
+
+# Bump when the records change, the entries of older versions are ignored.
+VERSION = 1
+
+# `records` holds one (type, name, lineno, docstring, args, parent) tuple per
+# class ('class'), method ('attribute') and function ('function'), depth
+# first in source order. `lineno` is 1-based, `args` is None for the classes
+# and `parent` is the index of the enclosing record (-1 at module level).
+Extraction = namedtuple('Extraction', 'module_doc records')
+
+
+def cleandoc(doc):
+    """
+    Same as `inspect.cleandoc`: expand the tabs, remove the indentation that
+    is common to the lines after the first one and the blank lines around.
+    """
+    lines = doc.expandtabs().split('\n')
+    margin = sys.maxsize
+    for line in lines[1:]:
+        content = len(line.lstrip())
+        if content:
+            margin = min(margin, len(line) - content)
+    if lines:
+        lines[0] = lines[0].lstrip()
+    if margin < sys.maxsize:
+        for i in range(1, len(lines)):
+            lines[i] = lines[i][margin:]
+    while lines and not lines[-1]:
+        lines.pop()
+    while lines and not lines[0]:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def get_docstring(node):
+    """
+    Same as `ast.get_docstring`, which imports `inspect` (and with it
+    tokenize, dis...) for its `cleandoc` on first use, an import that takes
+    longer than documenting a small file.
+    """
+    text = ast.get_docstring(node, clean=False)
+    return None if text is None else cleandoc(text)
+
+
+def argument_names(node):
+    """
+    Return the names of the positional arguments of a function, the tuple
+    arguments of Python 2 being flattened.
+    """
+    names = []
+    stack = list(reversed(node.args.args))
+    while stack:
+        arg = stack.pop()
+        if hasattr(arg, 'arg'):
+            names.append(arg.arg)
+        elif isinstance(arg, ast.Name):
+            names.append(arg.id)
+        else:
+            stack.extend(reversed(arg.elts))
+    return names
+
+
+def extract(module):
+    """
+    Return the `Extraction` of a parsed module. The functions and classes
+    are searched in the bodies of the module and of the functions, and the
+    methods in the bodies of the classes.
+    """
+    records = []
+
+    def visit(node, parent):
+        for child in node.body:
+            if isinstance(child, ast.ClassDef):
+                index = len(records)
+                records.append(('class', child.name, child.lineno, get_docstring(child), None, parent))
+                for sub_node in child.body:
+                    if isinstance(sub_node, ast.FunctionDef):
+                        records.append(('attribute', sub_node.name, sub_node.lineno,
+                                        get_docstring(sub_node), argument_names(sub_node), index))
+                        visit(sub_node, len(records) - 1)
+            elif isinstance(child, ast.FunctionDef):
+                records.append(('function', child.name, child.lineno,
+                                get_docstring(child), argument_names(child), parent))
+                visit(child, len(records) - 1)
+
+    visit(module, -1)
+    return Extraction(get_docstring(module), records)
+
+
+_text = type(u'')
+
+
+def _native(value):
+    # json gives unicode on Python 2, where the rest of the code works on utf-8 strings.
+    if bytes is str and isinstance(value, _text):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_native(item) for item in value]
+    return value
+
+
+class ExtractionCache(object):
+    """
+    A directory of `Extraction`s, one compact JSON file per source named
+    after the SHA-1 of the source. The files are written to a temporary file
+    which is then renamed, so that concurrent processes can share the cache.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+
+    @staticmethod
+    def key(source):
+        """
+        The cache key of a source, given as bytes.
+        """
+        import hashlib
+        return hashlib.sha1(source).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        """
+        Return the cached `Extraction` of the source with the given key, or
+        None.
+        """
+        import json
+        try:
+            with open(self.path(key)) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('version') != VERSION:
+            return None
+        return Extraction(_native(data['module_doc']),
+                          [tuple(_native(record)) for record in data['records']])
+
+    def set(self, key, extraction):
+        """
+        Store an `Extraction`. The sources that can't be serialized (e.g. a
+        Python 2 docstring which isn't valid UTF-8) are not cached.
+        """
+        import json
+        from tempfile import mkstemp
+        try:
+            data = json.dumps({'version': VERSION,
+                               'module_doc': extraction.module_doc,
+                               'records': extraction.records}, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return False
+        fd, temp_path = mkstemp(prefix='.' + key + '.', suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.rename(temp_path, self.path(key))
+        return True
+
+
+def load_extraction(source, cache=None):
+    """
+    Return the (extraction, module) of a source given as bytes. The module is
+    None when the extraction comes from the cache.
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(source)
+        extraction = cache.get(key)
+        if extraction is not None:
+            return extraction, None
+    module = ast.parse(source)
+    extraction = extract(module)
+    if cache is not None:
+        cache.set(key, extraction)
+    return extraction, module
@@ -0,0 +1,81 @@
+"""
+The unix socket server of ``SimpleRST.py -serve``. It lives in its own module
+so that the other modes of SimpleRST don't import the socket modules.
+"""
+import json
+import socket
+import threading
+import SocketServer
+
+from SimpleRST import document_source, unified_diff
+
+
+class DocumentRequestHandler(SocketServer.StreamRequestHandler):
+    """
+    .. py:class:: DocumentRequestHandler()
+
+      Read one JSON request per line and write one JSON response per line.
+      The connection gets closed when the client doesn't send anything for
+      `timeout` seconds.
+
+    """
+    def handle(self):
+        self.connection.settimeout(self.server.request_timeout)
+        try:
+            for line in iter(self.rfile.readline, ''):
+                response = self.server.dispatch(line)
+                self.wfile.write(json.dumps(response) + '\n')
+                self.wfile.flush()
+        except socket.timeout:
+            pass
+
+
+class DocumentServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    .. py:class:: DocumentServer(socket_path, templates, timeout=None, doc_format='auto')
+
+      A unix socket server which documents the sources sent by the clients.
+      A request is a JSON object with a `command` key:
+
+      * ``document``: return the documented `source` (and its `diff` when requested).
+      * ``check``: return whether `source` would change (and its `diff` when requested).
+      * ``ping``: check that the server is alive.
+      * ``shutdown``: stop the server once the pending requests are answered.
+
+      ``document`` and ``check`` take an optional `format`, the style of the docstrings.
+
+    """
+    def __init__(self, socket_path, templates, timeout=None, doc_format='auto'):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, DocumentRequestHandler)
+        self.templates = templates
+        self.request_timeout = timeout
+        self.doc_format = doc_format
+
+    def dispatch(self, line):
+        try:
+            request = json.loads(line)
+            command = request['command']
+            if command == 'ping':
+                return {'status': 'ok'}
+            if command == 'shutdown':
+                threading.Thread(target=self.shutdown).start()
+                return {'status': 'ok'}
+            if command not in ('document', 'check'):
+                raise ValueError('Unknown command {!r}'.format(command))
+            return self.document(command, request)
+        except Exception as e:
+            return {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+
+    def document(self, command, request):
+        # json gives unicode, the parser and the templates work on encoded strings.
+        source = request['source'].encode('utf-8')
+        file_name = request.get('file_name', u'<string>').encode('utf-8')
+        self.templates.refresh()
+        result = document_source(source, file_name, templates=self.templates,
+                                 doc_format=request.get('format') or self.doc_format)
+        response = {'status': 'ok', 'changed': result.changed}
+        if command == 'document':
+            response['source'] = result.source
+        if request.get('diff'):
+            response['diff'] = unified_diff(source, result.source, file_name)
+        return response
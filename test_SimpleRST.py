@@ -0,0 +1,306 @@
+"""
+Regression tests, run with ``python -m unittest discover`` (Python 2).
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from SimpleRST import DOCSTRING_FORMATS, Manager, Parser, TemplateRegistry, default_template_dir, document_source
+from simplerst_extraction import ExtractionCache, load_extraction
+
+
+class NoTrailingNewlineTest(unittest.TestCase):
+    """
+    The last logical line of a file without a trailing newline gets no
+    NEWLINE token from `tokenize` on Python 2.
+    """
+    def documented_names(self, source):
+        return [info.name for info in document_source(source, 'module.py').objects if info.rst]
+
+    def test_last_function(self):
+        self.assertEqual(self.documented_names('x = 1\ndef f():\n    return 1'), ['f'])
+
+    def test_last_method(self):
+        self.assertEqual(self.documented_names('class C:\n    def m(self):\n        pass'), ['C', 'm'])
+
+    def test_same_output_as_with_newline(self):
+        for source in ('x = 1\ndef f():\n    return 1', 'class C:\n    def m(self):\n        pass'):
+            self.assertEqual(document_source(source).source + '\n', document_source(source + '\n').source)
+
+    def test_module_docstring_only(self):
+        result = document_source('"""only doc"""', 'module.py')
+        self.assertTrue(result.source.startswith('"""\n'))
+        self.assertEqual(result.source.count('"""'), 2)
+        self.assertIn('only doc', result.source)
+
+
+class RewriteTest(unittest.TestCase):
+    """
+    Where the docstrings are written, and that documenting the output again
+    changes nothing.
+    """
+    def document(self, source):
+        result = document_source(source, 'module.py')
+        self.assertTrue(result.changed)
+        again = document_source(result.source, 'module.py')
+        self.assertFalse(again.changed)
+        self.assertEqual(again.source, result.source)
+        return result.source
+
+    def test_decorators(self):
+        source = self.document('@dec\n@dec2(1)\ndef f(x):\n    """\n    Do f.\n    x(int): the x\n    """\n'
+                               '    return x\n')
+        self.assertIn('@dec\n@dec2(1)\ndef f(x):\n    """\n', source)
+        self.assertEqual(source.count('Do f.'), 1)
+        self.assertIn(':param x:  the x', source)
+
+    def test_multi_line_header(self):
+        header = 'def f(a,\n      b=(1,\n         2)):\n'
+        source = self.document(header + '    return a\n')
+        self.assertIn(header + '    """\n', source)
+        self.assertIn(':param b:', source)
+        self.assertTrue(source.endswith('    """\n    return a\n'))
+
+    def test_single_quoted_docstring(self):
+        source = self.document("def f(x):\n    '''Do f.'''\n    return x\n")
+        self.assertNotIn("'''", source)
+        self.assertEqual(source.count('Do f.'), 1)
+
+    def test_raw_docstring(self):
+        source = self.document('def f(x):\n    r"""Do \\d f."""\n    return x\n')
+        self.assertNotIn('r"""', source)
+        self.assertEqual(source.count('Do \\d f.'), 1)
+
+    def test_inline_body(self):
+        source = self.document('class A(object):\n    def m(self): return 1\n    def n(self):\n        pass\n')
+        self.assertIn('    def m(self): return 1\n    def n(self):\n        """\n', source)
+        self.assertIn('.. py:attribute:: n()', source)
+        self.assertNotIn('.. py:attribute:: m()', source)
+
+
+class ParallelTest(unittest.TestCase):
+    """
+    A `-j` run documents the files and prints the messages like a serial run.
+    The messages are compared regardless of their order, since the walk order
+    of two directories may differ.
+    """
+    SOURCES = {'a.py': 'def f(x):\n    """\n    Do f.\n    x(int): the x\n    """\n    return x\n',
+               'b.py': 'class A(object):\n    def m(self, a):\n        return a\n',
+               'bad.py': 'def f(:\n',
+               os.path.join('sub', 'c.py'): 'def g(y):\n    return y\n'}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_on_copy(self, name, *options):
+        tree = os.path.join(self.directory, name)
+        for file_name, source in self.SOURCES.items():
+            path = os.path.join(tree, file_name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(source)
+        process = subprocess.Popen([sys.executable, 'SimpleRST.py', '-d', tree] + list(options),
+                                   stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+        output = sorted(process.communicate()[0].replace(tree, '<tree>').splitlines())
+        sources = {}
+        for file_name in self.SOURCES:
+            with open(os.path.join(tree, file_name)) as f:
+                sources[file_name] = f.read()
+        return output, sources
+
+    def test_same_as_serial(self):
+        output, sources = self.run_on_copy('serial')
+        self.assertIn('*** File <tree>/bad.py gets escaped. ***', output)
+        self.assertIn(':param a:', sources['b.py'])
+        self.assertEqual(self.run_on_copy('parallel', '-j', '3'), (output, sources))
+
+
+class DetectFormatTest(unittest.TestCase):
+    """
+    The default `auto` format has to read the legacy docstrings the way
+    `legacy` does.
+    """
+    def test_legacy_with_bare_section(self):
+        doc = "Do thing.\nx(int): the x\nReturns:\n    something"
+        self.assertEqual(DOCSTRING_FORMATS.detect(doc).name, 'legacy')
+        source = 'def f(x):\n    """\n    %s\n    """\n' % doc.replace('\n', '\n    ')
+        self.assertEqual(document_source(source).source, document_source(source, doc_format='legacy').source)
+
+    def test_google(self):
+        doc = "Summary.\n\nArgs:\n    x (int): the x\n\nReturns:\n    the y"
+        self.assertEqual(DOCSTRING_FORMATS.detect(doc).name, 'google')
+
+    def test_numpy(self):
+        doc = "Summary.\n\nParameters\n----------\nx : int\n    the x"
+        self.assertEqual(DOCSTRING_FORMATS.detect(doc).name, 'numpy')
+
+
+class CurrentTest(unittest.TestCase):
+    """
+    A file whose docstrings are all renderings of their templates takes the
+    fast path, which checks the extracted docstrings only.
+    """
+    def is_documented(self, source):
+        parser = Parser(TemplateRegistry(default_template_dir()))
+        parser.file_name = 'module.py'
+        parser.file_contents = source
+        return parser.is_documented(load_extraction(source)[0])
+
+    def test_inline_body(self):
+        source = 'class A(object):\n    def m(self):\n        pass\n\n    def n(self): return 1\n'
+        self.assertFalse(self.is_documented(source))
+        self.assertTrue(self.is_documented(document_source(source, 'module.py').source))
+
+    def test_removed_argument(self):
+        source = document_source('class A(object):\n    def m(self, a, b):\n        """\n        Do m.\n'
+                                 '        a(int): the a\n        b(str): the b\n        """\n', 'module.py').source
+        self.assertTrue(self.is_documented(source))
+        source = source.replace('def m(self, a, b)', 'def m(self, a)')
+        self.assertFalse(self.is_documented(source))
+        result = document_source(source, 'module.py')
+        self.assertTrue(result.changed)
+        self.assertNotIn(':param b:', result.source)
+        self.assertIn(':param a:  the a', result.source)
+        self.assertEqual(result.source.count('Do m.'), 1)
+        self.assertTrue(self.is_documented(result.source))
+
+    def test_added_argument(self):
+        source = document_source('def g(x):\n    """\n    Do g.\n    x(int): the x\n    """\n',
+                                 'module.py').source
+        result = document_source(source.replace('def g(x)', 'def g(x, y)'), 'module.py')
+        self.assertEqual(result.source.count('Do g.'), 1)
+        self.assertEqual(result.source.count('.. py:function::'), 1)
+        self.assertIn(':param y:', result.source)
+        self.assertTrue(self.is_documented(result.source))
+
+
+class ExtractionCacheTest(unittest.TestCase):
+    """
+    The extraction cache shared with doc_extractor.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_written_file_is_cached(self):
+        file_name = os.path.join(self.directory, 'module.py')
+        with open(file_name, 'w') as f:
+            f.write('def f(x):\n    return x\n')
+        cache = ExtractionCache(os.path.join(self.directory, 'cache'))
+        parser = Parser(TemplateRegistry(default_template_dir()))
+        parser.file_name = file_name
+        parser.extraction_cache = cache
+        parser.read_source()
+        self.assertTrue(parser.pars())
+        with open(file_name) as f:
+            written = f.read()
+        extraction = cache.get(cache.key(written))
+        self.assertIsNotNone(extraction)
+        self.assertEqual(extraction, load_extraction(written)[0])
+
+
+class GitTest(unittest.TestCase):
+    """
+    The files selected by `-staged` and `-changed_since`.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.git('init', '-q')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '--allow-empty',
+                 '-m', 'init')
+        for name in ('caf\xc3\xa9.py', 'plain.py', 'new caf\xc3\xa9.py'):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write('def f(x):\n    return x\n')
+        self.git('add', 'caf\xc3\xa9.py', 'plain.py')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def git(self, *args):
+        subprocess.check_call(('git',) + args, cwd=self.directory)
+
+    def changed_files(self, **options):
+        import argparse
+        return Manager(args=argparse.Namespace(d=self.directory, f=None, **options)).git_changed_files()
+
+    def test_non_ascii_names(self):
+        self.assertEqual(self.changed_files(staged=True), ['caf\xc3\xa9.py', 'plain.py'])
+        self.assertEqual(self.changed_files(changed_since='HEAD'),
+                         ['caf\xc3\xa9.py', 'new caf\xc3\xa9.py', 'plain.py'])
+
+
+class StartupTest(unittest.TestCase):
+    """
+    The start-up of the `-f` runs, which SimpleRST keeps short by importing
+    the modules of the other modes where they are used. The budget can be
+    raised on slow machines with ``SIMPLERST_STARTUP_BUDGET_MS``.
+    """
+    # Only imported by the modes that need them.
+    DEFERRED = ('SocketServer', 'socket', 'multiprocessing', 'subprocess', 'json', 'tempfile', 'shutil',
+                'difflib', 'hashlib', 'inspect', 'simplerst_server')
+
+    def test_deferred_imports(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'module.py')
+            with open(file_name, 'w') as f:
+                f.write('def f(x):\n    return x\n')
+            statement = ('import sys\nfrom SimpleRST import main\nmain(["-f", {!r}, "-check"])\n'
+                         'sys.stderr.write(" ".join(sys.modules))').format(file_name)
+            process = subprocess.Popen([sys.executable, '-c', statement], stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+            output, modules = process.communicate()
+        finally:
+            shutil.rmtree(directory)
+        modules = modules.split()
+        self.assertEqual(process.returncode, 0)
+        self.assertIn('SimpleRST', modules)
+        self.assertEqual([name for name in self.DEFERRED if name in modules], [])
+
+    def test_budget(self):
+        from benchmark import STARTUP_BUDGET_MS, bench_startup
+        budget = float(os.environ.get('SIMPLERST_STARTUP_BUDGET_MS', STARTUP_BUDGET_MS))
+        self.assertLess(bench_startup(3)['simplerst_file']['over_interpreter_ms'], budget)
+
+
+class ServerTest(unittest.TestCase):
+    """
+    The requests of `simplerst_client` to a `DocumentServer`.
+    """
+    def setUp(self):
+        from simplerst_server import DocumentServer
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'sock')
+        self.server = DocumentServer(self.socket_path, TemplateRegistry(default_template_dir()))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_non_ascii_source(self):
+        from simplerst_client import request
+        source = u'def f(x):\n    """\n    Caf\xe9 x.\n    x(int): the x\n    """\n    return x\n'
+        response = request(self.socket_path, 'document', source=source, file_name=u'uni.py', diff=True)
+        self.assertEqual(response['status'], 'ok', response.get('error'))
+        self.assertTrue(response['changed'])
+        self.assertIn(u'Caf\xe9 x.', response['source'])
+        self.assertIn(u':param x:', response['source'])
+        self.assertIn(u'uni.py', response['diff'])
+
+
+if __name__ == '__main__':
+    unittest.main()